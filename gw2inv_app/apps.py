@@ -1,4 +1,7 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+from .sqlite_profile import apply_profile
 
 __all__ = [
     "Gw2InventoryApp",
@@ -8,3 +11,6 @@ __all__ = [
 class Gw2InventoryApp(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "gw2inv_app"
+
+    def ready(self):
+        connection_created.connect(apply_profile)
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite: DTO loading, flag fields, fetcher syncs against stub clients
+and the slot write paths, over a synthetic account. See the `bench` command.
+"""
+
+from .cases import make_cases
+from .fixtures import Fixtures, make_fixtures
+from .runner import Case, Comparison, compare, load, run_cases, save
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""The benchmark cases, over the data of `fixtures.Fixtures`."""
+
+import os
+import typing
+
+from marshmallow import EXCLUDE
+
+from ..dto import InventoryResponseSchema, ItemSchema
+from ..dto.fast import bank_decoder, inventory_decoder, items_decoder
+from ..fetcher import (
+    Progress,
+    update_account_storage,
+    update_character_inventory,
+    update_characters,
+)
+from ..gw_client import Client
+from ..models import Character, FlagCharField, Item, ItemSlot
+from ..rate_limit import TokenBucket
+from ..replay import ReplayAdapter
+from ..slot_sync import diff_slots, inventory_states, load_slot_states, storage_states
+from ..writer import BatchWriter
+from .fixtures import Fixtures
+from .runner import Case
+
+
+def make_cases(fixtures: Fixtures, directory: str) -> typing.List[Case]:
+    """
+    All cases. Recorded responses of `fixtures`, and of the same account after
+    `Fixtures.changed`, are written to `directory` and served by stub clients.
+    """
+    changed = fixtures.changed()
+    replay = {}
+    for name, data in (("base", fixtures), ("changed", changed)):
+        replay[name] = os.path.join(directory, name)
+        os.makedirs(replay[name])
+        data.write_replay(replay[name])
+
+    def client(name: str = "base") -> Client:
+        return Client(
+            adapter=ReplayAdapter(replay[name]),
+            cache=False,
+            limiter=TokenBucket(burst=1_000_000, rate=1_000_000.0),
+        )
+
+    def account() -> typing.Dict[str, int]:
+        Item.objects.bulk_create(
+            (Item(**r.to_dict()) for r in items_decoder.decode(fixtures.items)),
+            batch_size=1000,
+        )
+        Character.objects.bulk_create(
+            Character(
+                name=core["name"],
+                race=core["race"],
+                profession=core["profession"],
+                level=core["level"],
+            )
+            for core in fixtures.characters.values()
+        )
+        return dict(Character.objects.values_list("name", "id"))
+
+    def account_client() -> Client:
+        account()
+        return client()
+
+    def synced_account() -> Client:
+        account()
+        with client() as base:
+            update_character_inventory(_progress(), base)
+            update_account_storage(_progress(), base)
+        return client("changed")
+
+    def slot_changes(
+        data: Fixtures, characters: typing.Dict[str, int]
+    ) -> typing.List[typing.Tuple[typing.Dict, typing.Any]]:
+        """Changes of all slots from the stored ones to those of `data`."""
+        result = []
+        for name, inventory in data.inventories.items():
+            owner = {"character_id": characters[name]}
+            fetched = inventory_states(inventory_decoder.load(inventory), characters)
+            stored = load_slot_states(
+                ItemSlot.objects.filter(bag__isnull=False, **owner)
+            )
+            result.append((owner, diff_slots(stored, fetched)))
+        owner = {"character_id": None, "storage": ItemSlot.StorageChoices.BANK}
+        fetched = storage_states(bank_decoder.load(data.bank), characters)
+        stored = load_slot_states(ItemSlot.objects.filter(**owner))
+        result.append((owner, diff_slots(stored, fetched)))
+        return result
+
+    def write_slots(changes):
+        with BatchWriter(_progress()) as writer:
+            for owner, owner_changes in changes:
+                writer.add_slot_changes(owner, owner_changes)
+
+    def initial_changes():
+        return slot_changes(fixtures, account())
+
+    def resync_changes():
+        characters = account()
+        write_slots(slot_changes(fixtures, characters))
+        return slot_changes(changed, characters)
+
+    def run_client(fn):
+        def run(stub: Client):
+            with stub:
+                fn(_progress(), stub)
+
+        return run
+
+    inventories = list(fixtures.inventories.values())
+    flags = Item._meta.get_field("flags")
+    flag_chars = FlagCharField(Item.Flags.choices, max_length=255)
+    flag_values = [frozenset(item["flags"]) for item in fixtures.items]
+
+    return [
+        Case(
+            "dto.items.marshmallow",
+            lambda _: ItemSchema(many=True).load(fixtures.items, unknown=EXCLUDE),
+        ),
+        Case("dto.items.compiled", lambda _: items_decoder.decode(fixtures.items)),
+        Case(
+            "dto.inventories.marshmallow",
+            lambda _: [
+                InventoryResponseSchema().load(i, unknown=EXCLUDE) for i in inventories
+            ],
+        ),
+        Case(
+            "dto.inventories.compiled",
+            lambda _: [inventory_decoder.decode(i) for i in inventories],
+        ),
+        Case(
+            "fields.flag_bits",
+            lambda _: [
+                flags.from_db_value(flags.get_prep_value(v), None, None)
+                for v in flag_values
+            ],
+        ),
+        Case(
+            "fields.flag_chars",
+            lambda _: [
+                flag_chars.from_db_value(flag_chars.get_prep_value(v), None, None)
+                for v in flag_values
+            ],
+        ),
+        Case(
+            "fetcher.update_characters",
+            run_client(update_characters),
+            setup=client,
+            database=True,
+        ),
+        Case(
+            "fetcher.inventories.initial",
+            run_client(update_character_inventory),
+            setup=account_client,
+            database=True,
+        ),
+        Case(
+            "fetcher.inventories.resync",
+            run_client(update_character_inventory),
+            setup=synced_account,
+            database=True,
+        ),
+        Case(
+            "fetcher.account_storage.resync",
+            run_client(update_account_storage),
+            setup=synced_account,
+            database=True,
+        ),
+        Case(
+            "writer.slots.initial",
+            write_slots,
+            setup=initial_changes,
+            database=True,
+        ),
+        Case(
+            "writer.slots.resync",
+            write_slots,
+            setup=resync_changes,
+            database=True,
+        ),
+    ]
+
+
+def _progress() -> Progress:
+    return Progress(lambda: None)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Synthetic account data shaped like API responses, generated from a seed."""
+
+import json
+import os
+import random
+import typing
+
+from ..models import Item, Profession, Race, Restriction
+from ..replay import fixture_name
+
+CHARACTERS = 60
+ITEMS = 10_000
+BAGS = 8
+BAG_SIZE = 20
+# A bank with all 16 tabs bought, 30 slots each.
+BANK_SLOTS = 16 * 30
+# Share of slots changed between two syncs, for the resync benchmarks.
+CHANGED_SHARE = 0.05
+
+
+class Fixtures(typing.NamedTuple):
+    # v2/items?ids= entries
+    items: typing.List[typing.Dict]
+    # v2/characters/:id/core by name
+    characters: typing.Dict[str, typing.Dict]
+    # v2/characters/:id/inventory by name
+    inventories: typing.Dict[str, typing.Dict]
+    # v2/account/bank
+    bank: typing.List[typing.Optional[typing.Dict]]
+
+    def write_replay(self, directory: str):
+        """Save the character responses as recordings for `replay.ReplayAdapter`."""
+        responses = {"v2/characters": list(self.characters)}
+        for name, core in self.characters.items():
+            responses[f"v2/characters/{name}/core"] = core
+            responses[f"v2/characters/{name}/inventory"] = self.inventories[name]
+        responses["v2/account/bank"] = self.bank
+        responses["v2/account/materials"] = []
+        for path, data in responses.items():
+            with open(os.path.join(directory, fixture_name(path)), "wt") as o:
+                json.dump(data, o)
+
+    def changed(self, seed: int = 1) -> "Fixtures":
+        """The same account after a sync's worth of changes to its slots."""
+        rnd = random.Random(seed)
+        item_ids = [item["id"] for item in self.items]
+
+        def change(slots: typing.List[typing.Optional[typing.Dict]]):
+            slots = list(slots)
+            for i in range(len(slots)):
+                if rnd.random() < CHANGED_SHARE:
+                    slots[i] = rnd.choice(
+                        [None, _slot(rnd, item_ids, list(self.characters))]
+                    )
+            return slots
+
+        inventories = {
+            name: {
+                "bags": [
+                    dict(bag, inventory=change(bag["inventory"]))
+                    for bag in inventory["bags"]
+                ]
+            }
+            for name, inventory in self.inventories.items()
+        }
+        return self._replace(inventories=inventories, bank=change(self.bank))
+
+
+def make_fixtures(
+    seed: int = 0,
+    characters: int = CHARACTERS,
+    items: int = ITEMS,
+    bank_slots: int = BANK_SLOTS,
+) -> Fixtures:
+    rnd = random.Random(seed)
+    item_list = [_item(rnd, item_id) for item_id in range(1, items + 1)]
+    item_ids = [item["id"] for item in item_list]
+    names = [f"Character {i}" for i in range(characters)]
+    return Fixtures(
+        items=item_list,
+        characters={name: _core(rnd, name) for name in names},
+        inventories={name: _inventory(rnd, item_ids, names) for name in names},
+        bank=[_slot(rnd, item_ids, names, empty=0.3) for _ in range(bank_slots)],
+    )
+
+
+def _item(rnd: random.Random, item_id: int) -> typing.Dict:
+    item = {
+        "id": item_id,
+        "name": f"Item {item_id}",
+        "chat_link": "[&AgEAAAA=]",
+        "icon": f"https://render.guildwars2.com/file/{item_id:040X}/{item_id}.png",
+        "description": "A synthetic item.",
+        "type": rnd.choice(Item.Type.values),
+        "rarity": rnd.choice(Item.Rarity.values),
+        "level": rnd.randint(0, 80),
+        "vendor_value": rnd.randint(0, 1000),
+        "flags": rnd.sample(Item.Flags.values, rnd.randint(0, 4)),
+        "game_types": ["Activity", "Dungeon", "Pve", "Wvw"],
+        "restrictions": rnd.sample(Restriction.values, rnd.choice([0, 0, 0, 1])),
+    }
+    if rnd.random() < 0.5:
+        item["details"] = {"type": "Default", "infix_upgrade": {"id": 1}}
+    return item
+
+
+def _core(rnd: random.Random, name: str) -> typing.Dict:
+    return {
+        "name": name,
+        "race": rnd.choice(Race.values),
+        "gender": rnd.choice(["Male", "Female"]),
+        "profession": rnd.choice(Profession.values),
+        "level": rnd.choice([80, 80, 80, rnd.randint(1, 79)]),
+        "age": rnd.randint(0, 10**7),
+        "created": "2015-08-28T20:00:00Z",
+        "deaths": rnd.randint(0, 5000),
+    }
+
+
+def _inventory(
+    rnd: random.Random, item_ids: typing.List[int], names: typing.List[str]
+) -> typing.Dict:
+    return {
+        "bags": [
+            {
+                "id": rnd.choice(item_ids),
+                "size": BAG_SIZE,
+                "inventory": [
+                    _slot(rnd, item_ids, names, empty=0.2) for _ in range(BAG_SIZE)
+                ],
+            }
+            for _ in range(BAGS)
+        ]
+    }
+
+
+def _slot(
+    rnd: random.Random,
+    item_ids: typing.List[int],
+    names: typing.List[str],
+    empty: float = 0.0,
+) -> typing.Optional[typing.Dict]:
+    if rnd.random() < empty:
+        return None
+    slot = {"id": rnd.choice(item_ids), "count": rnd.randint(1, 250)}
+    roll = rnd.random()
+    if roll < 0.05:
+        slot["binding"] = "Character"
+        slot["bound_to"] = rnd.choice(names)
+    elif roll < 0.3:
+        slot["binding"] = "Account"
+    if rnd.random() < 0.1:
+        slot["count"] = 1
+        slot["upgrades"] = [rnd.choice(item_ids)]
+        slot["stats"] = {"id": 1, "attributes": {"Power": 100}}
+        if rnd.random() < 0.3:
+            slot["infusions"] = [rnd.choice(item_ids)]
+    return slot
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Timing of benchmark cases, and saving and comparing their results."""
+
+import contextlib
+import datetime
+import io
+import json
+import platform
+import statistics
+import subprocess
+import time
+import typing
+
+from django.conf import settings
+from django.db import connection
+from django.db.transaction import atomic, set_rollback
+
+# Bumped when results of the same code are no longer comparable.
+FORMAT_VERSION = 1
+
+
+def _no_setup():
+    return None
+
+
+class Case(typing.NamedTuple):
+    name: str
+    # Timed; gets the result of `setup`.
+    run: typing.Callable[[typing.Any], typing.Any]
+    # Called before each run, untimed.
+    setup: typing.Callable[[], typing.Any] = _no_setup
+    # Run setup and run in a transaction rolled back afterwards.
+    database: bool = False
+
+
+class Comparison(typing.NamedTuple):
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current / self.baseline if self.baseline else float("inf")
+
+
+def measure(case: Case, repeat: int, warmup: int = 1) -> typing.Dict[str, typing.Any]:
+    """Median and minimum seconds of `repeat` runs, after `warmup` untimed ones."""
+    times = []
+    for i in range(warmup + repeat):
+        # Sync code prints every request; keep that out of the report.
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            if case.database:
+                stack.enter_context(atomic())
+            state = case.setup()
+            start = time.perf_counter()
+            case.run(state)
+            elapsed = time.perf_counter() - start
+            if case.database:
+                set_rollback(True)
+        if i >= warmup:
+            times.append(elapsed)
+    return {"median": statistics.median(times), "min": min(times), "runs": repeat}
+
+
+def environment() -> typing.Dict[str, typing.Any]:
+    """What the results depend on besides the code."""
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "database": connection.vendor,
+        "packed_upgrades": settings.GW2_PACKED_UPGRADES,
+        "sqlite_profile": settings.GW2_SQLITE_PROFILE,
+    }
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_cases(
+    cases: typing.Iterable[Case],
+    repeat: int,
+    on_result: typing.Callable[[str, typing.Dict], None] = lambda name, result: None,
+) -> typing.Dict[str, typing.Any]:
+    """Measure `cases`, returning the results document saved by `save`."""
+    results = {}
+    for case in cases:
+        results[case.name] = measure(case, repeat)
+        on_result(case.name, results[case.name])
+    return {
+        "format": FORMAT_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": _commit(),
+        "environment": environment(),
+        "results": results,
+    }
+
+
+def save(path: str, document: typing.Dict[str, typing.Any]):
+    with open(path, "wt") as o:
+        json.dump(document, o, indent=4)
+
+
+def load(path: str) -> typing.Dict[str, typing.Any]:
+    with open(path, "rt") as f:
+        document = json.load(f)
+    if document.get("format") != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported results format {document.get('format')}")
+    return document
+
+
+def compare(
+    baseline: typing.Dict[str, typing.Any], current: typing.Dict[str, typing.Any]
+) -> typing.List[Comparison]:
+    """Median times of the cases in both documents."""
+    return [
+        Comparison(name, baseline["results"][name]["median"], result["median"])
+        for name, result in current["results"].items()
+        if name in baseline["results"]
+    ]
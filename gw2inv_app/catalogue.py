@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Import of the full item catalogue from a local dump."""
+
+import collections
+import concurrent.futures
+import gzip
+import io
+import itertools
+import json
+import os
+import typing
+
+import django
+from django.apps import apps
+from django.db import connections
+from django.db.transaction import atomic
+from marshmallow import EXCLUDE, ValidationError
+
+from . import data_version
+from .dto import ItemSchema
+from .dto.fast import FastDecodeError, items_decoder
+from .gw_client import chunked
+from .json_stream import iter_array
+from .models import Item
+
+# Item fields updated when an imported item already exists.
+UPDATE_FIELDS = [
+    "name",
+    "chat_link",
+    "icon_url",
+    "description",
+    "type",
+    "rarity",
+    "flags",
+    "level",
+    "restrictions",
+]
+
+RawRecord = typing.Union[str, typing.Dict]
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ImportResult(typing.NamedTuple):
+    items: typing.List[typing.Dict]
+    # By item id, or "record N" for records without one.
+    errors: typing.Dict[typing.Any, typing.Any]
+
+
+def open_dump(path: typing.Union[str, os.PathLike]) -> typing.TextIO:
+    """Open a dump file as text, decompressing it if it is gzipped."""
+    f = open(path, "rb")
+    if f.peek(2)[:2] == b"\x1f\x8b":
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=f), encoding="utf-8")
+    return io.TextIOWrapper(f, encoding="utf-8")
+
+
+def read_records(f: typing.TextIO) -> typing.Iterator[RawRecord]:
+    """
+    Read records from either a JSON array or NDJSON, one record at a time.
+
+    NDJSON lines are returned unparsed, so that parsing is done by the workers.
+    """
+    head = f.read(1)
+    while head and head.isspace():
+        head = f.read(1)
+    if head == "[":
+        chunks = iter(lambda: f.read(READ_CHUNK_SIZE), "")
+        yield from iter_array(itertools.chain([head], chunks))
+        return
+
+    first = head + f.readline()
+    if first.strip():
+        yield first
+    for line in f:
+        if line.strip():
+            yield line
+
+
+def _init_worker():
+    if not apps.ready:
+        django.setup()
+
+
+def _record_key(record: typing.Any, number: int) -> typing.Any:
+    if isinstance(record, dict) and "id" in record:
+        return record["id"]
+    return f"record {number}"
+
+
+def validate_records(records: typing.List[RawRecord], start: int = 1) -> ImportResult:
+    """
+    Parse and validate a chunk of records with `ItemSchema`; `start` is the
+    number of the first record in the dump, to report records without an id.
+    """
+    data = []
+    keys = []
+    errors = {}
+    for number, record in enumerate(records, start):
+        if isinstance(record, str):
+            try:
+                record = json.loads(record)
+            except ValueError as e:
+                errors[f"record {number}"] = str(e)
+                continue
+        data.append(record)
+        keys.append(_record_key(record, number))
+
+    try:
+        items = [r.to_dict() for r in items_decoder.decode(data)]
+        return ImportResult(items, errors)
+    except FastDecodeError:
+        pass
+    try:
+        return ImportResult(ItemSchema(many=True).load(data, unknown=EXCLUDE), errors)
+    except ValidationError as e:
+        items = [d for i, d in enumerate(e.valid_data) if i not in e.messages]
+        errors.update((keys[i], e.messages[i]) for i in e.messages)
+        return ImportResult(items, errors)
+
+
+def import_items(
+    records: typing.Iterable[RawRecord],
+    workers: typing.Optional[int] = None,
+    chunk_size: int = 2000,
+    batch_size: int = 5000,
+    update: bool = False,
+    on_progress: typing.Callable[[int, int], None] = lambda done, errors: None,
+) -> typing.Tuple[int, typing.Dict]:
+    """
+    Validate `records` in a process pool and write them to `Item` in bulk.
+
+    Existing items are left alone, or updated if `update` is set. Invalid
+    records, including unparsable NDJSON lines, are skipped. Returns the
+    number of items inserted or updated, and the errors by item id (or
+    "record N" for records without one).
+    """
+    written = 0
+    errors = {}
+    pending: typing.Dict[int, Item] = {}
+
+    def flush():
+        nonlocal written
+        items = list(pending.values())
+        pending.clear()
+        if not items:
+            return
+        if update:
+            Item.objects.bulk_create(
+                items,
+                batch_size=batch_size,
+                update_conflicts=True,
+                unique_fields=["id"],
+                update_fields=UPDATE_FIELDS,
+            )
+        else:
+            existing = set(
+                Item.objects.filter(id__in=[i.id for i in items]).values_list(
+                    "id", flat=True
+                )
+            )
+            items = [i for i in items if i.id not in existing]
+            Item.objects.bulk_create(items, batch_size=batch_size)
+        written += len(items)
+
+    def add(result: ImportResult):
+        pending.update((data["id"], Item(**data)) for data in result.items)
+        errors.update(result.errors)
+        if len(pending) >= batch_size:
+            flush()
+        on_progress(written + len(pending), len(errors))
+
+    # Chunks submitted and not yet written; enough to keep all workers busy.
+    max_in_flight = 2 * (workers or os.cpu_count() or 1)
+    in_flight: typing.Deque[concurrent.futures.Future] = collections.deque()
+
+    # Forked workers must not share the parent's database connections.
+    connections.close_all()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker
+    ) as pool, atomic():
+        start = 1
+        for chunk in chunked(records, chunk_size):
+            if len(in_flight) >= max_in_flight:
+                add(in_flight.popleft().result())
+            in_flight.append(pool.submit(validate_records, chunk, start))
+            start += len(chunk)
+        while in_flight:
+            add(in_flight.popleft().result())
+        flush()
+        if written:
+            data_version.bump()
+    return written, errors
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Whole-account stack consolidation.
+
+All item slots are loaded into columnar arrays, and partial stacks of the
+same item and binding are merged with vectorized group-by operations:
+
+1. Stackable partial stacks are sorted by group (item, binding, bound_to)
+   and fullest first.
+2. A group of `n` slots holding `total` items needs `ceil(total / STACK_SIZE)`
+   slots; the first ones are targets, the others sources that get emptied.
+3. Sources' items and targets' free space are laid out as intervals on one
+   axis, and each overlap of a source and a target interval is a move.
+"""
+
+import typing
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, Exists, IntegerField, OuterRef, Q, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Item, ItemSlot
+
+STACK_SIZE = 250
+
+# Items of these types never stack.
+UNSTACKABLE_TYPES = [
+    Item.Type.ARMOR,
+    Item.Type.BACK,
+    Item.Type.BAG,
+    Item.Type.GATHERING,
+    Item.Type.MINIATURE,
+    Item.Type.TOOL,
+    Item.Type.TRINKET,
+    Item.Type.WEAPON,
+]
+
+STORAGE_CODES = {
+    ItemSlot.StorageChoices.INVENTORY: 0,
+    ItemSlot.StorageChoices.BANK: 1,
+    ItemSlot.StorageChoices.MATERIALS: 2,
+}
+BINDING_CODES = {
+    None: 0,
+    ItemSlot.BindingChoices.ACCOUNT: 1,
+    ItemSlot.BindingChoices.CHARACTER: 2,
+}
+
+
+class SlotArrays(typing.NamedTuple):
+    """One entry per slot; -1 stands for no character / bag / bound_to."""
+
+    slot_id: np.ndarray
+    item_id: np.ndarray
+    count: np.ndarray
+    character_id: np.ndarray
+    storage: np.ndarray  # STORAGE_CODES
+    bag: np.ndarray
+    index: np.ndarray
+    binding: np.ndarray  # BINDING_CODES
+    bound_to_id: np.ndarray
+    # Stackable item, and the slot has no charges, upgrades or infusions.
+    stackable: np.ndarray
+
+
+class Consolidation(typing.NamedTuple):
+    # Moves, in order: `count` items from slot `source` to slot `target`.
+    source: np.ndarray
+    target: np.ndarray
+    item_id: np.ndarray
+    count: np.ndarray
+    # Slots emptied by the moves.
+    freed: np.ndarray
+
+    def moves(self) -> typing.Iterator[typing.Tuple[int, int, int, int]]:
+        """(source slot id, target slot id, item id, count) per move."""
+        return zip(
+            self.source.tolist(),
+            self.target.tolist(),
+            self.item_id.tolist(),
+            self.count.tolist(),
+        )
+
+
+def _codes(field: str, codes: typing.Dict) -> Case:
+    return Case(
+        *(When(**{field: k}, then=Value(v)) for k, v in codes.items() if k is not None),
+        default=Value(codes.get(None, -1)),
+        output_field=IntegerField(),
+    )
+
+
+def _upgraded() -> Q:
+    if settings.GW2_PACKED_UPGRADES:
+        return ~Q(upgrade_ids=[]) | ~Q(infusion_ids=[])
+    return Q(
+        *(
+            Exists(through.objects.filter(itemslot_id=OuterRef("pk")))
+            for through in (ItemSlot.upgrades.through, ItemSlot.infusions.through)
+        ),
+        _connector=Q.OR,
+    )
+
+
+def load_slots(slots=None) -> SlotArrays:
+    """Load all item slots, or those of the given queryset, in one query."""
+    if slots is None:
+        slots = ItemSlot.objects.all()
+    rows = slots.values_list(
+        "id",
+        "item_id",
+        "count",
+        Coalesce("character_id", -1),
+        _codes("storage", STORAGE_CODES),
+        Coalesce("bag", -1),
+        "index",
+        _codes("binding", BINDING_CODES),
+        Coalesce("bound_to_id", -1),
+        Case(
+            When(
+                Q(item__type__in=UNSTACKABLE_TYPES)
+                | Q(charges__isnull=False)
+                | _upgraded(),
+                then=Value(0),
+            ),
+            default=Value(1),
+            output_field=IntegerField(),
+        ),
+    )
+    # All columns are integers; the raw cursor skips the ORM's per-row converters.
+    sql, params = rows.query.sql_with_params()
+    with connections[rows.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        table = np.array(cursor.fetchall(), dtype=np.int64)
+    table = table.reshape(-1, len(SlotArrays._fields))
+    arrays = SlotArrays(*table.T)
+    return arrays._replace(stackable=arrays.stackable.astype(bool))
+
+
+def consolidate(slots: SlotArrays, stack_size: int = STACK_SIZE) -> Consolidation:
+    """Moves merging the partial stacks of `slots`, and the slots they free."""
+    partial = (
+        slots.stackable
+        & (slots.count < stack_size)
+        & (slots.storage != STORAGE_CODES[ItemSlot.StorageChoices.MATERIALS])
+    )
+    ids = slots.slot_id[partial]
+    item = slots.item_id[partial]
+    count = slots.count[partial]
+    binding = slots.binding[partial]
+    bound_to = slots.bound_to_id[partial]
+
+    # Group, then fullest stacks first, so they become the targets.
+    order = np.lexsort((ids, -count, bound_to, binding, item))
+    ids, item, count = ids[order], item[order], count[order]
+    binding, bound_to = binding[order], bound_to[order]
+
+    n = len(ids)
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = (
+        (item[1:] != item[:-1])
+        | (binding[1:] != binding[:-1])
+        | (bound_to[1:] != bound_to[:-1])
+    )
+    starts = np.flatnonzero(new_group)
+    group = np.cumsum(new_group) - 1
+    sizes = np.diff(np.append(starts, n))
+    totals = np.add.reduceat(count, starts) if n else np.zeros(0, dtype=np.int64)
+    needed = -(-totals // stack_size)
+
+    rank = np.arange(n) - starts[group]
+    mergeable = (sizes > needed)[group]
+    is_target = mergeable & (rank < needed[group])
+    is_source = mergeable & ~is_target
+
+    # Sources' items on one axis, groups one after another.
+    src = np.flatnonzero(is_source)
+    src_end = np.cumsum(count[src])
+    src_total = np.zeros(len(starts), dtype=np.int64)
+    np.add.at(src_total, group[src], count[src])
+    base = np.cumsum(src_total) - src_total
+
+    # Targets' free space on the same axis, capped at the group's source total.
+    tgt = np.flatnonzero(is_target)
+    space = stack_size - count[tgt]
+    cum = np.cumsum(space)
+    first_in_group = np.ones(len(tgt), dtype=bool)
+    first_in_group[1:] = group[tgt][1:] != group[tgt][:-1]
+    group_start = np.maximum.accumulate(np.where(first_in_group, cum - space, 0))
+    tgt_end = base[group[tgt]] + np.minimum(cum - group_start, src_total[group[tgt]])
+
+    # Every overlap of a source and a target interval is one move.
+    ends = np.union1d(src_end, tgt_end)
+    ends = ends[ends > 0]
+    amounts = np.diff(np.concatenate(([0], ends)))
+    source = src[np.searchsorted(src_end, ends)]
+    target = tgt[np.searchsorted(tgt_end, ends)]
+
+    return Consolidation(
+        source=ids[source],
+        target=ids[target],
+        item_id=item[source],
+        count=amounts,
+        freed=ids[src],
+    )
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Version of the account data, bumped by every write of it.
+
+Read views derive their ETags and cache keys from it, so between syncs they
+are answered from the cache, without touching the database. Writers call
+`bump` in the transaction of the write: `BatchWriter.flush`, the catalogue
+import and the item totals rebuild, and the sync marking characters deleted.
+The version is stored in the `DataVersion` row and cached for
+settings.GW2_DATA_VERSION_TTL seconds, after which syncs run by other
+processes become visible even with a per-process cache.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.db.transaction import atomic, on_commit
+
+from .models import DataVersion
+
+CACHE_KEY = "gw2inv:data_version"
+
+
+def _timeout():
+    return settings.GW2_DATA_VERSION_TTL or None
+
+
+def current(using: str = DEFAULT_DB_ALIAS) -> int:
+    """The version of the data in database `using`."""
+    key = CACHE_KEY if using == DEFAULT_DB_ALIAS else f"{CACHE_KEY}:{using}"
+    version = cache.get(key)
+    if version is None:
+        version = (
+            DataVersion.objects.using(using).values_list("version", flat=True).first()
+            or 0
+        )
+        cache.set(key, version, _timeout())
+    return version
+
+
+def bump() -> int:
+    """
+    Start a new version, invalidating everything cached by the old one. In a
+    transaction, the new version is cached only once it commits.
+    """
+    with atomic():
+        DataVersion.objects.get_or_create(id=1)
+        DataVersion.objects.filter(id=1).update(version=F("version") + 1)
+        version = DataVersion.objects.values_list("version", flat=True).get(id=1)
+        on_commit(lambda: cache.set(CACHE_KEY, version, _timeout()))
+    return version
+
+
+def etag(request, *args, **kwargs) -> str:
+    """ETag of read views, for `django.views.decorators.http.condition`."""
+    return f"data-{current()}"
@@ -8,3 +8,4 @@ from .character_schema import (
     InventoryResponseSchema,
 )
 from .item_shema import ItemSchema
+from .material_schema import MaterialSchema
@@ -2,7 +2,7 @@
 
 from marshmallow import Schema, pre_load
 
-from .item_slot import ItemSlotMixin
+from .item_slot import ItemSlotMixin, unwrap_list
 
 
 class BankSchema(Schema, ItemSlotMixin):
@@ -12,6 +12,5 @@ class BankSchema(Schema, ItemSlotMixin):
     """
 
     @pre_load(pass_many=True)
-    def unwrap(self, data, **kwargs):
-        # Remove null list elements.
-        return [el for el in data if el is not None]
+    def unwrap(self, data, many, **kwargs):
+        return unwrap_list(data, many)
@@ -1,19 +1,18 @@
 # -*- coding: utf-8 -*-
 import typing
 
-from marshmallow import Schema, fields, pre_load
+from marshmallow import EXCLUDE, Schema, fields, pre_load
 
-from .item_slot import ItemSlotMixin
+from .item_slot import ItemSlotMixin, unwrap_list
 
 
 class InventorySchema(Schema, ItemSlotMixin):
     class Meta:
-        unknown = "EXCLUDE"
+        unknown = EXCLUDE
 
     @pre_load(pass_many=True)
-    def unwrap(self, data, **kwargs):
-        # Remove null list elements.
-        return [el for el in data if el is not None]
+    def unwrap(self, data, many, **kwargs):
+        return unwrap_list(data, many)
 
 
 class BagsSchema(Schema):
@@ -42,13 +41,22 @@ class BagsSchema(Schema):
             Character
             Account
         bound_to (string) (optional, only if character bound) - Name of the character the item is bound to.
+
+    Empty bag slots are null; `unwrap` removes them and sets `index` of the others.
     """
 
     class Meta:
-        unknown = "EXCLUDE"
+        unknown = EXCLUDE
 
+    id = fields.Integer()
+    index = fields.Integer()
+    size = fields.Integer()
     inventory = fields.Nested(InventorySchema, many=True)
 
+    @pre_load(pass_many=True)
+    def unwrap(self, data, many, **kwargs):
+        return unwrap_list(data, many)
+
 
 class EquipmentSchema(Schema):
     """
@@ -100,7 +108,7 @@ class EquipmentSchema(Schema):
     """
 
     class Meta:
-        unknown = "EXCLUDE"
+        unknown = EXCLUDE
 
     id = fields.Integer(required=True)
     slot = fields.String()
@@ -166,7 +174,7 @@ class CharacterSchema(Schema, CoreSchemaMixin):
     """
 
     class Meta:
-        unknown = "EXCLUDE"
+        unknown = EXCLUDE
 
     bags = fields.Nested(BagsSchema, many=True)
     equipment = fields.Nested(EquipmentSchema, many=True)
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Fast decoders for the hot DTO schemas.
+
+`CompiledSchema` turns a marshmallow schema into a plain-Python decoder that
+checks the same declarations (required fields, field types, `OneOf` choices,
+null filtering and indexing of the `unwrap` hooks) and produces compact
+`Record` objects.
+Anything the compiled decoder does not handle exactly, such as values that
+marshmallow would coerce, makes it fall back to the marshmallow schema, so
+results and errors stay the same as with marshmallow.
+"""
+
+import typing
+
+from marshmallow import EXCLUDE, Schema, fields, validate
+
+from .bank_schema import BankSchema
+from .character_schema import EquipmentResponseSchema, InventoryResponseSchema
+from .item_shema import ItemSchema
+from .material_schema import MaterialSchema
+
+
+class FastDecodeError(Exception):
+    """Input not handled by a compiled decoder; use marshmallow instead."""
+
+
+class Record:
+    """Base of the compact `__slots__` records produced by the compiled decoders."""
+
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name in self.__slots__:
+            setattr(self, name, kwargs.get(name))
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        """Same dict as loaded by marshmallow; absent fields are omitted."""
+        result = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if value is None:
+                continue
+            if isinstance(value, list):
+                value = [v.to_dict() if isinstance(v, Record) else v for v in value]
+            elif isinstance(value, Record):
+                value = value.to_dict()
+            result[name] = value
+        return result
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, n) == getattr(other, n) for n in self.__slots__
+        )
+
+    def __repr__(self):
+        args = ", ".join(f"{k}={v!r}" for k, v in self.to_dict().items())
+        return f"{type(self).__name__}({args})"
+
+
+_record_types: typing.Dict[typing.Type[Schema], typing.Type[Record]] = {}
+
+
+def record_type(schema_cls: typing.Type[Schema]) -> typing.Type[Record]:
+    """The record class for a schema, named e.g. BankRecord for BankSchema."""
+    if schema_cls not in _record_types:
+        _record_types[schema_cls] = type(
+            schema_cls.__name__.replace("Schema", "") + "Record",
+            (Record,),
+            {"__slots__": tuple(schema_cls._declared_fields), "__module__": __name__},
+        )
+    return _record_types[schema_cls]
+
+
+Checker = typing.Callable[[typing.Any], typing.Any]
+
+
+def _fail(value):
+    raise FastDecodeError(value)
+
+
+def _choices(field: fields.Field) -> typing.Optional[typing.FrozenSet]:
+    choices = None
+    for validator in field.validators:
+        if not isinstance(validator, validate.OneOf):
+            return _fail(validator)
+        choices = frozenset(validator.choices)
+    return choices
+
+
+def _compile_field(field: fields.Field) -> Checker:
+    if isinstance(field, fields.Nested):
+        return CompiledSchema(type(field.schema), many=field.many).decode
+
+    if isinstance(field, fields.List):
+        inner = _compile_field(field.inner)
+
+        def check_list(value):
+            if type(value) is not list:
+                _fail(value)
+            return [inner(v) for v in value]
+
+        return check_list
+
+    if isinstance(field, fields.Integer) and not field.validators:
+        # Integer is a subclass of Number, but not of String; bool is rejected.
+        def check_int(value):
+            if type(value) is not int:
+                _fail(value)
+            return value
+
+        return check_int
+
+    if type(field) is fields.String:
+        choices = _choices(field)
+
+        def check_str(value):
+            if type(value) is not str or (choices is not None and value not in choices):
+                _fail(value)
+            return value
+
+        return check_str
+
+    # Not supported, e.g. Url: decode with marshmallow if the field is present.
+    return _fail
+
+
+class CompiledSchema:
+    """Decoder compiled from marshmallow `schema_cls`."""
+
+    def __init__(self, schema_cls: typing.Type[Schema], many: bool = False):
+        self.schema_cls = schema_cls
+        self.many = many
+        self.record = record_type(schema_cls)
+
+        hooks = {k: v for k, v in schema_cls._hooks.items() if v}
+        # See `item_slot.unwrap_list`.
+        self.unwrap = hooks == {("pre_load", True): ["unwrap"]}
+        self.supported = not hooks or self.unwrap
+        # Decoder of the elements, for `iter_load`.
+        self._element = CompiledSchema(schema_cls) if many else self
+
+        self._fields = [
+            (name, field.data_key or name, field.required, _compile_field(field))
+            for name, field in schema_cls._declared_fields.items()
+            if not field.dump_only
+        ]
+        self._nested = {
+            name: CompiledSchema(type(field.schema), many=field.many)
+            for name, field in schema_cls._declared_fields.items()
+            if isinstance(field, fields.Nested)
+        }
+
+    def _decode_one(self, data) -> Record:
+        if type(data) is not dict:
+            _fail(data)
+        record = self.record()
+        for name, key, required, check in self._fields:
+            value = data.get(key)
+            if value is not None:
+                setattr(record, name, check(value))
+            elif required or key in data:
+                _fail(data)
+        return record
+
+    def _decode_indexed(self, data, index: int) -> Record:
+        record = self._decode_one(data)
+        record.index = index
+        return record
+
+    def decode(self, data):
+        """Decode without fallback; raises `FastDecodeError` on anything unexpected."""
+        if not self.supported:
+            _fail(data)
+        if not self.many:
+            return self._decode_one(data)
+        if type(data) is not list:
+            _fail(data)
+        if self.unwrap:
+            return [
+                self._decode_indexed(d, i) for i, d in enumerate(data) if d is not None
+            ]
+        return [self._decode_one(d) for d in data]
+
+    def load(self, data):
+        """Decode, falling back to marshmallow. Invalid data raises `ValidationError`."""
+        try:
+            return self.decode(data)
+        except FastDecodeError:
+            return self.from_marshmallow(
+                self.schema_cls(many=self.many).load(data, unknown=EXCLUDE)
+            )
+
+    def iter_load(self, elements: typing.Iterable) -> typing.Iterator[Record]:
+        """
+        `load` of a `many` decoder, one element at a time as they are streamed,
+        e.g. by `json_stream.iter_array_bytes`. Only elements the compiled
+        decoder does not handle fall back to marshmallow.
+        """
+        for index, data in enumerate(elements):
+            if self.unwrap:
+                if data is None:
+                    continue
+                record = self._element.load(data)
+                record.index = index
+                yield record
+            else:
+                yield self._element.load(data)
+
+    def from_marshmallow(self, loaded):
+        """Convert marshmallow-loaded data into records."""
+        if self.many:
+            return [self._from_dict(d) for d in loaded]
+        return self._from_dict(loaded)
+
+    def _from_dict(self, loaded: typing.Dict) -> Record:
+        record = self.record()
+        for name in self.schema_cls._declared_fields:
+            value = loaded.get(name)
+            if value is not None and name in self._nested:
+                value = self._nested[name].from_marshmallow(value)
+            setattr(record, name, value)
+        return record
+
+
+bank_decoder = CompiledSchema(BankSchema, many=True)
+equipment_decoder = CompiledSchema(EquipmentResponseSchema)
+inventory_decoder = CompiledSchema(InventoryResponseSchema)
+item_decoder = CompiledSchema(ItemSchema)
+items_decoder = CompiledSchema(ItemSchema, many=True)
+materials_decoder = CompiledSchema(MaterialSchema, many=True)
@@ -2,7 +2,7 @@
 from marshmallow import Schema, fields, validate
 
 from gw2inv_app.models import Item as ModelItem
-from gw2inv_app.models import Race
+from gw2inv_app.models import Restriction
 
 
 class ItemSchema(Schema):
@@ -105,4 +105,6 @@ class ItemSchema(Schema):
         fields.String(validate=validate.OneOf(ModelItem.Flags.values)), required=True
     )
     level = fields.Integer(required=True)
-    restrictions = fields.List(fields.String(validate=validate.OneOf(Race.values)))
+    restrictions = fields.List(
+        fields.String(validate=validate.OneOf(Restriction.values))
+    )
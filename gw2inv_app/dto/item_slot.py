@@ -1,11 +1,26 @@
 # -*- coding: utf-8 -*-
+import typing
 
 from marshmallow import fields
 
 
+def unwrap_list(data: typing.List, many: bool) -> typing.List:
+    """
+    Remove null list elements, recording the position of each remaining element
+    in its `index` key.
+    """
+    if not many:
+        return data
+    return [
+        dict(el, index=i) if isinstance(el, dict) else el
+        for i, el in enumerate(data)
+        if el is not None
+    ]
+
+
 class ItemSlotMixin:
     """
-    Item slot properties for BankSchema and CharacterSchema.bags.inventory.
+    Item slot properties for BankSchema, MaterialSchema and CharacterSchema.bags.inventory.
 
     id (number) – The item's ID.
     count (number) – The amount of items in the item stack.
@@ -30,11 +45,16 @@ class ItemSlotMixin:
             Precision (decimal) – Precision
             Toughness (decimal) – Toughness
             Vitality (decimal) – Vitality
+
+    index (number) - Position of the slot in its bag or storage, set by `unwrap_list`.
     """
 
     id = fields.Integer(required=True)
+    index = fields.Integer()
     count = fields.Integer()
+    charges = fields.Integer()
     binding = fields.String()
     bound_to = fields.String()
     upgrades = fields.List(fields.Integer())
     upgrade_slot_indices = fields.List(fields.Integer())
+    infusions = fields.List(fields.Integer())
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from marshmallow import Schema, fields, pre_load
+
+from .item_slot import ItemSlotMixin, unwrap_list
+
+
+class MaterialSchema(Schema, ItemSlotMixin):
+    """
+    v2/account/materials -> List[MaterialSchema]
+
+    id (number) - The item ID of the material.
+    category (number) - The material category the item belongs to. Can be resolved against /v2/materials.
+    binding (string, optional) - The binding of the material. Either Account or omitted.
+    count (number) - The number of the material that is stored in the account vault.
+
+    Every storable material is listed, with a count of 0 if none is stored.
+    """
+
+    category = fields.Integer()
+
+    @pre_load(pass_many=True)
+    def unwrap(self, data, many, **kwargs):
+        return unwrap_list(data, many)
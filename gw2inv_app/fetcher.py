@@ -1,12 +1,30 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import contextlib
+import datetime
+import os
+import socket
 import typing
+import uuid
 
+from django.conf import settings
 from django.db.transaction import atomic
-from django.utils.timezone import now
 from django.utils.translation import gettext
 
-from .gw_client import Client
+from . import data_version
+from .gw_client import AsyncClient, Client, ItemLookup, ItemStatus
 from .models import Character, Item, ItemSlot, PendingData
+from .slot_sync import (
+    FetchedStorage,
+    diff_slots,
+    inventory_states,
+    known_items_only,
+    load_slot_states,
+)
+from .writer import BatchWriter
+
+# PendingData rows leased per query.
+CLAIM_BATCH_SIZE = 500
 
 
 class Progress:
@@ -31,9 +49,72 @@ class Progress:
         self.progress()
 
 
-def update_characters(progress: Progress):
-    client = Client()
+def _use_client(client: typing.Optional[Client]) -> typing.ContextManager[Client]:
+    """Use the given client as is, or create one that is closed after use."""
+    if client is not None:
+        return contextlib.nullcontext(client)
+    return Client()
+
+
+def lease_owner() -> str:
+    """A new owner of leased PendingData rows, unique to this process and call."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def update_characters(progress: Progress, client: typing.Optional[Client] = None):
+    with _use_client(client) as client:
+        _update_characters(progress, client)
+
+
+def _update_characters(progress: Progress, client: Client):
+    _queue_characters(progress, client)
+    with BatchWriter(progress) as writer:
+        for pending in _claim_characters(lease_owner()):
+            _update_character(pending, writer, client)
+
+
+def update_characters_concurrent(
+    progress: Progress,
+    concurrency: typing.Optional[int] = None,
+    client: typing.Optional[Client] = None,
+):
+    """
+    Like `update_characters`, but fetch the characters concurrently.
+
+    At most `concurrency` requests are in flight at a time, all of them going
+    through the client's rate limiter. Database writes are done afterwards in
+    the calling thread in batches, as the ORM cannot be used from the event loop.
+    """
+    concurrency = concurrency or settings.GW2_SYNC_CONCURRENCY
+    with _use_client(client) as client:
+        _queue_characters(progress, client)
+        pending = _claim_characters(lease_owner())
+        with AsyncClient(client, max_workers=concurrency) as async_client:
+            results = asyncio.run(
+                fetch_characters(async_client, [p.api_id for p in pending], concurrency)
+            )
+        with BatchWriter(progress) as writer:
+            for p in pending:
+                _store_character(p, results[p.api_id], writer)
+
+
+async def fetch_characters(
+    client: AsyncClient, names: typing.Iterable[str], concurrency: int
+) -> typing.Dict[str, typing.Union[typing.Dict, Exception]]:
+    """Fetch core data of the named characters, returning the data or error per name."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(name: str):
+        async with semaphore:
+            try:
+                return name, await client.get_character_core(name)
+            except Exception as e:
+                return name, e
+
+    return dict(await asyncio.gather(*(fetch(name) for name in names)))
 
+
+def _queue_characters(progress: Progress, client: Client):
     existing_characters = set(Character.objects.values_list("name", flat=True))
     characters: typing.Set[str] = set(client.get_characters())
 
@@ -43,7 +124,9 @@ def update_characters(progress: Progress):
 
     if extra_characters:
         progress.add_target()
-        (Character.objects.filter(name__in=extra_characters).update(deleted=True))
+        with atomic():
+            Character.objects.filter(name__in=extra_characters).update(deleted=True)
+            data_version.bump()
         progress.add_current()
 
     pending = []
@@ -71,37 +154,230 @@ def update_characters(progress: Progress):
     if pending:
         PendingData.objects.bulk_create(pending)
 
-    for pending in PendingData.objects.filter(
-        target=PendingData.TargetChoices.CHARACTER,
-        completed__isnull=True,
-        failed_count__lt=PendingData.FAILED_REPEAT_COUNT,
-    ):
-        _update_character(pending, progress, client)
 
+def _claim_characters(owner: str) -> typing.List[PendingData]:
+    """Lease the open character rows to `owner`, skipping rows leased by others."""
+    lease = datetime.timedelta(seconds=settings.GW2_QUEUE_LEASE_SECONDS)
+    targets = [PendingData.TargetChoices.CHARACTER]
+    claimed = []
+    while True:
+        # Claimed rows stay leased until written, so they are not claimed again.
+        rows = PendingData.objects.claim(owner, CLAIM_BATCH_SIZE, targets, lease)
+        if not rows:
+            return claimed
+        claimed.extend(rows)
 
-def _update_character(pending: PendingData, progress: Progress, client: Client):
-    is_update = pending.is_update
-    char_id = pending.api_id
+
+def _update_character(pending: PendingData, writer: BatchWriter, client: Client):
     try:
-        data = client.get_character_core(char_id)
-        with atomic():
-            _, created = Character.objects.update_or_create(defaults=data, name=char_id)
-            if is_update == created:
-                # Inverse condition, as which is the unexpected one.
-                print("Unexpected", "create" if is_update else "update", "for", char_id)
-            pending.completed = now()
-            pending.save()
+        data = client.get_character_core(pending.api_id)
+    except Exception as e:
+        data = e
+    _store_character(pending, data, writer)
+
+
+def _store_character(
+    pending: PendingData,
+    data: typing.Union[typing.Dict, Exception],
+    writer: BatchWriter,
+):
+    if isinstance(data, Exception):
+        writer.fail(
+            pending,
+            gettext("Failed to update character {}").format(pending.api_id),
+            data,
+        )
+    else:
+        writer.add_character(data, pending)
+
+
+def _store_items(lookups: typing.Dict[int, ItemLookup], writer: BatchWriter):
+    """Write found items, and report the others as errors."""
+    for item_id, lookup in lookups.items():
+        if lookup.status == ItemStatus.FOUND:
+            writer.add_item(lookup.data)
+        else:
+            writer.fail(
+                None,
+                gettext("Failed to update item {}: {}").format(
+                    item_id, lookup.status.value
+                ),
+                lookup.errors,
+            )
+
+
+def queue_inventories(progress: Progress):
+    """Add PendingData rows for the inventories of the characters not deleted."""
+    wanted = set(Character.objects.filter(deleted=False).values_list("name", flat=True))
+    wanted -= set(
+        PendingData.objects.open()
+        .filter(target=PendingData.TargetChoices.SLOT)
+        .values_list("api_id", flat=True)
+    )
+    if not wanted:
+        return
+
+    progress.add_target(len(wanted))
+    PendingData.objects.bulk_create(
+        PendingData(target=PendingData.TargetChoices.SLOT, api_id=name, json="")
+        for name in sorted(wanted)
+    )
+
+
+def update_character_inventory(
+    progress: Progress, client: typing.Optional[Client] = None
+):
+    """
+    Sync the inventories of all characters.
+
+    The inventories are fetched concurrently by `worker_pool.drain`. The
+    fetched bags are compared with the stored slots by (bag, index), and only
+    the differences are written; see `slot_sync`.
+    """
+    from .worker_pool import drain
+
+    queue_inventories(progress)
+    drain(progress, targets=[PendingData.TargetChoices.SLOT], client=client)
+
+
+def _store_inventory(
+    pending: PendingData,
+    data: typing.Union[typing.Any, Exception],
+    writer: BatchWriter,
+    client: Client,
+):
+    """Diff a fetched inventory against the stored one and pass the changes to `writer`."""
+    message = gettext("Failed to update inventory of {}").format(pending.api_id)
+    if isinstance(data, Exception):
+        writer.fail(pending, message, data)
+        return
+
+    characters = dict(Character.objects.values_list("name", "id"))
+    if pending.api_id not in characters:
+        # The character may still be waiting in the writer.
+        writer.flush()
+        characters = dict(Character.objects.values_list("name", "id"))
+    character_id = characters.get(pending.api_id)
+    if character_id is None:
+        writer.fail(pending, message, gettext("unknown character"))
+        return
+
+    fetched = inventory_states(data, characters)
+    try:
+        known = _resolve_items(
+            (i for state in fetched.values() for i in state.item_ids()),
+            writer,
+            client,
+        )
     except Exception as e:
-        progress.add_error(gettext("Failed to update character {}").format(char_id))
-        print("Failed to update {}:".format(char_id), e)
-        pending.failed = now()
-        pending.failed_count += 1
-        pending.save()
+        writer.fail(pending, message, e)
+        return
+
+    stored = load_slot_states(
+        ItemSlot.objects.filter(character_id=character_id, bag__isnull=False)
+    )
+    changes = diff_slots(stored, known_items_only(fetched, known))
+    writer.add_slot_changes({"character_id": character_id}, changes, pending)
+
+
+def queue_storage(progress: Progress):
+    """Add PendingData rows for the account bank and material storage."""
+    wanted = {ItemSlot.StorageChoices.BANK, ItemSlot.StorageChoices.MATERIALS}
+    wanted -= set(
+        PendingData.objects.open()
+        .filter(target=PendingData.TargetChoices.STORAGE)
+        .values_list("api_id", flat=True)
+    )
+    if not wanted:
+        return
+
+    progress.add_target(len(wanted))
+    PendingData.objects.bulk_create(
+        PendingData(target=PendingData.TargetChoices.STORAGE, api_id=kind, json="")
+        for kind in sorted(wanted)
+    )
+
 
-    progress.add_current()
+def update_account_storage(progress: Progress, client: typing.Optional[Client] = None):
+    """
+    Sync the account bank and material storage.
 
+    Each is fetched with a single streamed request by `worker_pool.drain`,
+    its slots decoded one at a time into the slot states that are diffed by
+    slot index against the stored slots without character.
+    """
+    from .worker_pool import drain
 
-def update_character_inventory(progress: Progress):
-    client = Client()
-    # TODO ...
-    pass
+    queue_storage(progress)
+    drain(progress, targets=[PendingData.TargetChoices.STORAGE], client=client)
+
+
+def _store_storage(
+    pending: PendingData,
+    data: typing.Union[FetchedStorage, Exception],
+    writer: BatchWriter,
+    client: Client,
+):
+    """Diff a fetched storage against the stored one and pass the changes to `writer`."""
+    kind = ItemSlot.StorageChoices(pending.api_id)
+    message = gettext("Failed to update {}").format(kind.label)
+    if isinstance(data, Exception):
+        writer.fail(pending, message, data)
+        return
+
+    fetched = data.resolve(dict(Character.objects.values_list("name", "id")))
+    try:
+        # All missing items of the storage in one batch.
+        known = _resolve_items(
+            (i for state in fetched.values() for i in state.item_ids()),
+            writer,
+            client,
+        )
+    except Exception as e:
+        writer.fail(pending, message, e)
+        return
+
+    stored = load_slot_states(
+        ItemSlot.objects.filter(character__isnull=True, storage=kind)
+    )
+    changes = diff_slots(stored, known_items_only(fetched, known))
+    writer.add_slot_changes({"character_id": None, "storage": kind}, changes, pending)
+
+
+def _resolve_items(
+    item_ids: typing.Iterable[int], writer: BatchWriter, client: Client
+) -> typing.Set[int]:
+    """Ids of `item_ids` that exist, fetching the ones not in the database into `writer`."""
+    wanted = set(item_ids)
+    known = set(Item.objects.filter(id__in=wanted).values_list("id", flat=True))
+    missing = wanted - known
+    if missing:
+        lookups = client.get_items(missing)
+        _store_items(lookups, writer)
+        known.update(
+            item_id
+            for item_id, lookup in lookups.items()
+            if lookup.status == ItemStatus.FOUND
+        )
+    return known
+
+
+def full_update(progress: Progress, client: typing.Optional[Client] = None):
+    """
+    Sync characters, then their inventories and the account storage together
+    with `worker_pool.drain`.
+    """
+    from .worker_pool import drain
+
+    with _use_client(client) as client:
+        update_characters_concurrent(progress, client=client)
+        queue_inventories(progress)
+        queue_storage(progress)
+        drain(
+            progress,
+            targets=[
+                PendingData.TargetChoices.SLOT,
+                PendingData.TargetChoices.STORAGE,
+            ],
+            client=client,
+        )
@@ -1,22 +1,141 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import concurrent.futures
+import enum
+import json
 import time
 import typing
 
 import requests
+import requests.adapters
 from django.conf import settings
+from marshmallow import EXCLUDE, ValidationError
 
 from .dto import *
+from .dto.fast import (
+    FastDecodeError,
+    Record,
+    bank_decoder,
+    equipment_decoder,
+    inventory_decoder,
+    item_decoder,
+    items_decoder,
+    materials_decoder,
+)
+from .http_cache import ResponseCache, get_default_cache
+from .http_metrics import registry as metrics
+from .json_stream import iter_array_bytes
+from .rate_limit import (
+    RETRY_STATUSES,
+    TokenBucket,
+    get_default_limiter,
+    parse_retry_after,
+)
+from .replay import ReplayAdapter, get_default_adapter
 
 API_BASE_URL = "https://api.guildwars2.com/"
 
+# Maximum number of ids the API accepts in a single `?ids=` query.
+MAX_IDS_PER_REQUEST = 200
+
+# Bytes read at a time from streamed responses.
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class ItemStatus(enum.Enum):
+    FOUND = "found"
+    MISSING = "missing"
+    INVALID = "invalid"
+
+
+class ItemLookup(typing.NamedTuple):
+    """Result of resolving one item id with `Client.get_items`."""
+
+    status: ItemStatus
+    data: typing.Optional[Record] = None
+    errors: typing.Optional[typing.Dict] = None
+
+
+def chunked(values: typing.Iterable, size: int) -> typing.Iterator[typing.List]:
+    chunk = []
+    for value in values:
+        chunk.append(value)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def make_session(
+    pool_size: int, adapter: typing.Optional[requests.adapters.BaseAdapter] = None
+) -> requests.Session:
+    """
+    Create a session that keeps up to `pool_size` connections alive to the API host.
+
+    A custom transport `adapter`, such as `replay.ReplayAdapter`, replaces the
+    default HTTP adapter.
+    """
+    session = requests.Session()
+    if adapter is None:
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, pool_block=True
+        )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
 
 class Client:
-    def __init__(self):
-        self._api_base_url = API_BASE_URL
-        self._last_fetch = 0
-        self._time_between_fetch_seconds = 1
+    """
+    GW2 API client.
+
+    The client holds a pooled keep-alive session, so create one per sync and
+    close it when done, preferably using it as a context manager.
+    """
+
+    def __init__(
+        self,
+        pool_size: typing.Optional[int] = None,
+        timeout: typing.Optional[typing.Tuple[float, float]] = None,
+        session: typing.Optional[requests.Session] = None,
+        limiter: typing.Optional[TokenBucket] = None,
+        max_retries: typing.Optional[int] = None,
+        base_url: typing.Optional[str] = None,
+        cache: typing.Union[ResponseCache, None, bool] = True,
+        adapter: typing.Optional[requests.adapters.BaseAdapter] = None,
+    ):
+        pool_size = pool_size or settings.GW2_HTTP_POOL_SIZE
+        if adapter is None and session is None:
+            adapter = get_default_adapter(pool_size)
 
-    def _make_args(self, api: str) -> typing.Dict[str, str]:
+        self._api_base_url = base_url or settings.GW2_API_BASE_URL
+        if cache is True:
+            # Replayed responses must not end up in the cache.
+            replaying = isinstance(adapter, ReplayAdapter)
+            cache = None if replaying else get_default_cache()
+        self.cache = cache or None
+        self._limiter = limiter or get_default_limiter()
+        self._max_retries = (
+            max_retries if max_retries is not None else settings.GW2_API_MAX_RETRIES
+        )
+        self._timeout = timeout or (
+            settings.GW2_HTTP_CONNECT_TIMEOUT,
+            settings.GW2_HTTP_READ_TIMEOUT,
+        )
+        self._session = session or make_session(pool_size, adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def _make_args(self, api: str) -> typing.Dict[str, typing.Any]:
         key = settings.GW2_API_KEY
         return {
             "url": f"{self._api_base_url}{api}",
@@ -24,46 +143,253 @@ class Client:
                 "Authorization": f"Bearer {key}",
                 "X-Schema-Version": "latest",  # TODO: Sticky this later
             },
+            "timeout": self._timeout,
         }
 
     def _get(self, path: str):
-        sleep_time = self._last_fetch + self._time_between_fetch_seconds - time.time()
-        if sleep_time > 0:
-            print("Sleeping", sleep_time, end="")
-            time.sleep(sleep_time)
-            print("\r", " " * 64, "\r", end="")
-
-        print("GET", path)
-        response = requests.get(**self._make_args(path))
-        print(
-            "<-",
-            response.status_code,
-            ", content-length:",
-            response.headers.get("content-length"),
-        )
+        api_key = settings.GW2_API_KEY
+        entry = self.cache.get(path, api_key) if self.cache else None
+        if entry is not None and self.cache.is_fresh(path, entry):
+            self.cache.count(hits=1, bytes_saved=len(entry.body))
+            metrics.cache(path, "hits")
+            return json.loads(entry.body)
+
+        args = self._make_args(path)
+        if entry is not None:
+            if entry.etag:
+                args["headers"]["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                args["headers"]["If-Modified-Since"] = entry.last_modified
+
+        response = self._request(path, args)
+        if response.status_code == 304 and entry is not None:
+            self.cache.count(revalidated=1, bytes_saved=len(entry.body))
+            metrics.cache(path, "revalidated")
+            self.cache.refresh(path, api_key, entry)
+            return json.loads(entry.body)
+        if response.status_code == 304:
+            # Nothing cached to revalidate, e.g. a proxy answered for us: a miss.
+            args = self._make_args(path)
+            args["headers"]["Cache-Control"] = "no-cache"
+            response = self._request(path, args)
+            if response.status_code == 304:
+                raise requests.HTTPError(
+                    f"304 Not Modified without a cached response for {path}",
+                    response=response,
+                )
+
         response.raise_for_status()
-        self._last_fetch = time.time()
+        if self.cache:
+            self.cache.count(misses=1)
+            metrics.cache(path, "misses")
+            self.cache.put(
+                path,
+                api_key,
+                response.content,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
         return response.json()
 
+    def _request(
+        self, path: str, args: typing.Dict[str, typing.Any], stream: bool = False
+    ) -> requests.Response:
+        """
+        Do the request, waiting for the rate limiter and retrying when asked to
+        slow down. Every attempt is recorded in `http_metrics.registry`; bodies
+        of streamed responses are counted as they are read.
+        """
+        for attempt in range(self._max_retries + 1):
+            waited = self._limiter.acquire()
+
+            start = time.perf_counter()
+            try:
+                response = self._session.get(**args, stream=stream)
+            except Exception:
+                metrics.request(path, 0, time.perf_counter() - start, waited)
+                raise
+            metrics.request(
+                path, response.status_code, time.perf_counter() - start, waited
+            )
+            if not stream:
+                metrics.received(path, len(response.content))
+            if response.status_code in RETRY_STATUSES and attempt < self._max_retries:
+                response.close()
+                self._limiter.backoff(
+                    parse_retry_after(response.headers.get("Retry-After"))
+                )
+                continue
+
+            self._limiter.on_success()
+            return response
+
+    def _stream(self, path: str) -> typing.Iterator[typing.Any]:
+        """
+        Yield elements of a JSON array response as they arrive.
+
+        Streamed responses bypass the response cache.
+        """
+        with self._request(path, self._make_args(path), stream=True) as response:
+            response.raise_for_status()
+            yield from iter_array_bytes(
+                _counted(path, response.iter_content(STREAM_CHUNK_SIZE)),
+                response.encoding or "utf-8",
+            )
+
+    def iter_bank(self) -> typing.Iterator[Record]:
+        """Yield validated non-empty bank slots one at a time."""
+        return bank_decoder.iter_load(self._stream("v2/account/bank"))
+
+    def iter_materials(self) -> typing.Iterator[Record]:
+        """Like `get_materials`, one slot at a time."""
+        return materials_decoder.iter_load(self._stream("v2/account/materials"))
+
     def get_characters(self) -> typing.List[str]:
         return self._get("v2/characters")
 
     def get_character_core(self, character_id: str):
         data = self._get("v2/characters/" + character_id + "/core")
-        obj = CoreSchema().load(data, unknown="EXCLUDE")
+        obj = CoreSchema().load(data, unknown=EXCLUDE)
         return obj
 
     def get_character_equipment(self, character_id: str):
         data = self._get("v2/characters/" + character_id + "/equipment")
-        obj = EquipmentResponseSchema().load(data, unknown="EXCLUDE")
+        obj = equipment_decoder.load(data)
         return obj
 
     def get_character_inventory(self, character_id: str):
         data = self._get("v2/characters/" + character_id + "/inventory")
-        obj = InventoryResponseSchema().load(data, unknown="EXCLUDE")
+        obj = inventory_decoder.load(data)
         return obj
 
+    def get_materials(self) -> typing.List[Record]:
+        """Material storage; all storable materials, including those with count 0."""
+        data = self._get("v2/account/materials")
+        return materials_decoder.load(data)
+
     def get_item(self, item_id: int):
-        data = self._get("v2/item/" + str(item_id))
-        obj = ItemSchema().load(data, unknown="EXCLUDE")
+        data = self._get("v2/items/" + str(item_id))
+        obj = ItemSchema().load(data, unknown=EXCLUDE)
         return obj
+
+    def get_items(self, ids: typing.Iterable[int]) -> typing.Dict[int, ItemLookup]:
+        """
+        Resolve many items using `v2/items?ids=`, `MAX_IDS_PER_REQUEST` ids per request.
+
+        Every requested id is present in the result. Ids the API did not return
+        are marked MISSING, and ids whose data did not pass `ItemSchema` are
+        marked INVALID.
+        """
+        result: typing.Dict[int, ItemLookup] = {}
+        for chunk in chunked(sorted(set(ids)), MAX_IDS_PER_REQUEST):
+            result.update(self._load_items(chunk, self._get_item_chunk(chunk)))
+        return result
+
+    def _get_item_chunk(self, chunk: typing.List[int]) -> typing.List[typing.Dict]:
+        try:
+            return self._get("v2/items?ids=" + ",".join(str(i) for i in chunk))
+        except requests.HTTPError as e:
+            # The API responds 404 when none of the ids exist.
+            if e.response is not None and e.response.status_code == 404:
+                return []
+            raise
+
+    @staticmethod
+    def _load_items(
+        chunk: typing.List[int], data: typing.List[typing.Dict]
+    ) -> typing.Dict[int, ItemLookup]:
+        result = {i: ItemLookup(ItemStatus.MISSING) for i in chunk}
+        errors = {}
+        try:
+            items = items_decoder.decode(data)
+        except FastDecodeError:
+            try:
+                loaded = ItemSchema(many=True).load(data, unknown=EXCLUDE)
+            except ValidationError as e:
+                loaded = e.valid_data
+                errors = e.messages
+            items = [item_decoder.from_marshmallow(d) for d in loaded]
+
+        for index, raw in enumerate(data):
+            item_id = raw.get("id") if isinstance(raw, dict) else None
+            if item_id not in result:
+                continue
+            if index in errors:
+                result[item_id] = ItemLookup(ItemStatus.INVALID, errors=errors[index])
+            else:
+                result[item_id] = ItemLookup(ItemStatus.FOUND, data=items[index])
+        return result
+
+
+def _counted(path: str, chunks: typing.Iterable[bytes]) -> typing.Iterator[bytes]:
+    for chunk in chunks:
+        metrics.received(path, len(chunk))
+        yield chunk
+
+
+class AsyncClient:
+    """
+    asyncio interface to `Client`.
+
+    The requests run in a thread pool of `max_workers` threads on the wrapped
+    client's pooled session, so they share its connections, rate limiter and
+    configuration. Close the async client before closing the wrapped client.
+    """
+
+    def __init__(
+        self, client: typing.Optional[Client] = None, max_workers: int = 8, **kwargs
+    ):
+        self._client = client or Client(pool_size=max_workers, **kwargs)
+        self._owns_client = client is None
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="gw2-client"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        if self._owns_client:
+            self._client.close()
+
+    async def _run(self, fn: typing.Callable, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def get_characters(self) -> typing.List[str]:
+        return await self._run(self._client.get_characters)
+
+    async def get_character_core(self, character_id: str):
+        return await self._run(self._client.get_character_core, character_id)
+
+    async def get_character_equipment(self, character_id: str):
+        return await self._run(self._client.get_character_equipment, character_id)
+
+    async def get_character_inventory(self, character_id: str):
+        return await self._run(self._client.get_character_inventory, character_id)
+
+    async def get_materials(self):
+        return await self._run(self._client.get_materials)
+
+    async def get_items(
+        self, ids: typing.Iterable[int]
+    ) -> typing.Dict[int, ItemLookup]:
+        """Like `Client.get_items`, but the chunks are fetched concurrently."""
+        chunks = list(chunked(sorted(set(ids)), MAX_IDS_PER_REQUEST))
+        data = await asyncio.gather(
+            *(self._run(self._client._get_item_chunk, chunk) for chunk in chunks)
+        )
+        result: typing.Dict[int, ItemLookup] = {}
+        for chunk, chunk_data in zip(chunks, data):
+            result.update(self._client._load_items(chunk, chunk_data))
+        return result
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+import collections
+import hashlib
+import json
+import os
+import threading
+import time
+import typing
+
+from django.conf import settings
+
+# Paths whose responses practically never change.
+IMMUTABLE_PREFIXES = ("v2/items",)
+
+
+class CacheEntry(typing.NamedTuple):
+    body: bytes
+    etag: typing.Optional[str]
+    last_modified: typing.Optional[str]
+    fetched: float
+
+
+class ResponseCache:
+    """
+    On-disk cache of API response bodies.
+
+    Entries are keyed by request path and a hash of the API key, so that
+    accounts never see each other's data. An entry is fresh for `ttl_immutable`
+    seconds for paths in `IMMUTABLE_PREFIXES` and for `ttl_volatile` seconds
+    otherwise; stale entries are revalidated with their ETag / Last-Modified.
+    When the total size exceeds `max_bytes`, least recently used entries are
+    removed.
+
+    Each file holds a JSON metadata line followed by the raw response body.
+    Counters of hits, misses etc. are kept in `stats`; update them with `count`,
+    as clients in several threads share the cache.
+    """
+
+    def __init__(
+        self,
+        directory: typing.Union[str, os.PathLike],
+        max_bytes: int,
+        ttl_immutable: float,
+        ttl_volatile: float,
+        clock: typing.Callable[[], float] = time.time,
+    ):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.ttl_immutable = ttl_immutable
+        self.ttl_volatile = ttl_volatile
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._index: typing.Optional[collections.OrderedDict] = None
+        self._size = 0
+        self._stats_lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    @staticmethod
+    def _key(path: str, api_key: str) -> str:
+        account = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        return account + "-" + hashlib.sha256(path.encode()).hexdigest()[:32]
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _load_index(self) -> collections.OrderedDict:
+        if self._index is None:
+            os.makedirs(self.directory, exist_ok=True)
+            files = []
+            for e in os.scandir(self.directory):
+                if not e.is_file():
+                    continue
+                if e.name.endswith(".tmp"):
+                    # Left over by a write that was interrupted.
+                    os.remove(e.path)
+                    continue
+                files.append((e.stat().st_mtime, e.name, e.stat().st_size))
+            files.sort()
+            self._index = collections.OrderedDict(
+                (name, size) for _, name, size in files
+            )
+            self._size = sum(self._index.values())
+        return self._index
+
+    def count(self, **stats: int):
+        """Add to the `stats` counters, e.g. `count(hits=1)`."""
+        with self._stats_lock:
+            self.stats.update(stats)
+
+    def ttl(self, path: str) -> float:
+        if path.startswith(IMMUTABLE_PREFIXES):
+            return self.ttl_immutable
+        return self.ttl_volatile
+
+    def is_fresh(self, path: str, entry: CacheEntry) -> bool:
+        return self._clock() - entry.fetched < self.ttl(path)
+
+    def get(self, path: str, api_key: str) -> typing.Optional[CacheEntry]:
+        key = self._key(path, api_key)
+        with self._lock:
+            index = self._load_index()
+            if key not in index:
+                return None
+            try:
+                with open(self._file(key), "rb") as f:
+                    meta = json.loads(f.readline())
+                    body = f.read()
+                os.utime(self._file(key))
+            except (OSError, ValueError):
+                self._remove(key)
+                return None
+            index.move_to_end(key)
+        return CacheEntry(body, meta["etag"], meta["last_modified"], meta["fetched"])
+
+    def put(
+        self,
+        path: str,
+        api_key: str,
+        body: bytes,
+        etag: typing.Optional[str] = None,
+        last_modified: typing.Optional[str] = None,
+        fetched: typing.Optional[float] = None,
+    ):
+        key = self._key(path, api_key)
+        meta = {
+            "path": path,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched": self._clock() if fetched is None else fetched,
+        }
+        data = json.dumps(meta).encode() + b"\n" + body
+        with self._lock:
+            index = self._load_index()
+            tmp = self._file(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._file(key))
+            self._size += len(data) - index.pop(key, 0)
+            index[key] = len(data)
+            self._evict()
+
+    def refresh(self, path: str, api_key: str, entry: CacheEntry):
+        """Mark a revalidated entry as freshly fetched."""
+        self.put(path, api_key, entry.body, entry.etag, entry.last_modified)
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._index) > 1:
+            key = next(iter(self._index))
+            self._remove(key)
+            self.count(evictions=1)
+
+    def _remove(self, key: str):
+        self._size -= self._index.pop(key, 0)
+        try:
+            os.remove(self._file(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._load_index()):
+                self._remove(key)
+
+
+_default_cache: typing.Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> typing.Optional[ResponseCache]:
+    """The cache shared by all clients in this process, or None if caching is disabled."""
+    global _default_cache
+    if not settings.GW2_CACHE_DIR:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache(
+                settings.GW2_CACHE_DIR,
+                max_bytes=settings.GW2_CACHE_MAX_BYTES,
+                ttl_immutable=settings.GW2_CACHE_TTL_IMMUTABLE,
+                ttl_volatile=settings.GW2_CACHE_TTL_VOLATILE,
+            )
+        return _default_cache
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Per-endpoint metrics of GW2 API requests.
+
+Requests are grouped by endpoint family, the path with ids replaced and the
+query dropped, e.g. `v2/characters/:id/inventory` or `v2/items`. For each
+family, `registry` counts requests by status, response latencies in a
+histogram, bytes received, seconds spent waiting for the rate limiter, and
+response cache hits. It is process wide and thread safe.
+"""
+
+import collections
+import re
+import threading
+import typing
+
+# Upper bounds in seconds of the latency histogram buckets.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+CACHE_RESULTS = ("hits", "revalidated", "misses")
+
+_NUMBER = re.compile(r"^\d+$")
+
+
+def endpoint(path: str) -> str:
+    """Endpoint family of an API path."""
+    segments = path.split("?", 1)[0].strip("/").split("/")
+    for i, segment in enumerate(segments):
+        # Character names in v2/characters/:id/..., and numeric ids anywhere.
+        if (i > 0 and segments[i - 1] == "characters") or _NUMBER.match(segment):
+            segments[i] = ":id"
+    return "/".join(segments)
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.statuses: typing.Counter[int] = collections.Counter()
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.bytes = 0
+        self.limiter_wait = 0.0
+        self.cache: typing.Counter[str] = collections.Counter()
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "requests": self.requests,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "latency": {
+                "sum": self.latency_sum,
+                # Cumulative counts, as in Prometheus.
+                "buckets": {
+                    _bound(le): count
+                    for le, count in zip(
+                        LATENCY_BUCKETS, _cumulative(self.latency_buckets)
+                    )
+                },
+            },
+            "bytes": self.bytes,
+            "limiter_wait": self.limiter_wait,
+            "cache": {k: self.cache[k] for k in CACHE_RESULTS},
+        }
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: typing.Dict[str, EndpointMetrics] = {}
+
+    def _get(self, path: str) -> EndpointMetrics:
+        family = endpoint(path)
+        metrics = self._endpoints.get(family)
+        if metrics is None:
+            metrics = self._endpoints[family] = EndpointMetrics()
+        return metrics
+
+    def request(self, path: str, status: int, latency: float, limiter_wait: float):
+        """
+        Record a response, received `latency` seconds after the request was
+        sent. Status 0 stands for requests that failed without a response.
+        """
+        bucket = next(i for i, le in enumerate(LATENCY_BUCKETS) if latency <= le)
+        with self._lock:
+            metrics = self._get(path)
+            metrics.requests += 1
+            metrics.statuses[status] += 1
+            metrics.latency_buckets[bucket] += 1
+            metrics.latency_sum += latency
+            metrics.limiter_wait += limiter_wait
+
+    def received(self, path: str, size: int):
+        """Record `size` bytes of a response body."""
+        with self._lock:
+            self._get(path).bytes += size
+
+    def cache(self, path: str, result: str):
+        """Record a response cache lookup; `result` is one of CACHE_RESULTS."""
+        with self._lock:
+            self._get(path).cache[result] += 1
+
+    def snapshot(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Metrics by endpoint family, as JSON-serializable dicts."""
+        with self._lock:
+            return {
+                family: metrics.to_dict()
+                for family, metrics in sorted(self._endpoints.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = Registry()
+
+
+def _cumulative(counts: typing.Iterable[int]) -> typing.List[int]:
+    result, total = [], 0
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+def _bound(le: float) -> str:
+    return "+Inf" if le == float("inf") else str(le)
+
+
+def prometheus(snapshot: typing.Dict[str, typing.Dict[str, typing.Any]]) -> str:
+    """A `Registry.snapshot` in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples):
+        lines.append(f"# HELP gw2_api_{name} {help_text}")
+        lines.append(f"# TYPE gw2_api_{name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels)
+            lines.append(f"gw2_api_{name}{suffix}{{{label_text}}} {value}")
+
+    items = snapshot.items()
+    metric(
+        "requests_total",
+        "counter",
+        "API requests by endpoint and response status; 0 when none was received.",
+        (
+            ("", [("endpoint", e), ("status", status)], count)
+            for e, m in items
+            for status, count in m["statuses"].items()
+        ),
+    )
+    metric(
+        "request_duration_seconds",
+        "histogram",
+        "Time from sending a request to receiving the response headers.",
+        [
+            sample
+            for e, m in items
+            for sample in (
+                *(
+                    ("_bucket", [("endpoint", e), ("le", le)], count)
+                    for le, count in m["latency"]["buckets"].items()
+                ),
+                ("_sum", [("endpoint", e)], m["latency"]["sum"]),
+                ("_count", [("endpoint", e)], m["requests"]),
+            )
+        ],
+    )
+    metric(
+        "response_bytes_total",
+        "counter",
+        "Bytes of response bodies received.",
+        (("", [("endpoint", e)], m["bytes"]) for e, m in items),
+    )
+    metric(
+        "limiter_wait_seconds_total",
+        "counter",
+        "Time requests waited for the rate limiter.",
+        (("", [("endpoint", e)], m["limiter_wait"]) for e, m in items),
+    )
+    metric(
+        "cache_lookups_total",
+        "counter",
+        "Response cache lookups by result.",
+        (
+            ("", [("endpoint", e), ("result", result)], count)
+            for e, m in items
+            for result, count in m["cache"].items()
+        ),
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Per-account item totals, maintained incrementally from slot changes.
+
+`ItemLocationTotal` holds the amount and number of stacks of each item per
+location, and `ItemTotal` sums them up per item, so "how many of X do I own"
+is a primary key lookup. Slot writers pass the changes they write to
+`apply_deltas` in the same transaction. `check` compares the tables with an
+aggregate over all slots, and `rebuild` recomputes them from it.
+"""
+
+import typing
+
+from django.db.models import Count, Sum
+from django.db.transaction import atomic
+
+from . import data_version
+from .models import ItemLocationTotal, ItemSlot, ItemTotal
+
+# (item id, location)
+Key = typing.Tuple[int, str]
+
+
+def location(character_id: typing.Optional[int], storage: str) -> str:
+    if character_id is not None:
+        return f"character:{character_id}"
+    return storage
+
+
+class Deltas:
+    """Changes of total and stacks per item and location."""
+
+    def __init__(self):
+        self._deltas: typing.Dict[Key, typing.List[int]] = {}
+
+    def add(self, item_id: int, where: str, count: int, stacks: int = 1):
+        delta = self._deltas.setdefault((item_id, where), [0, 0])
+        delta[0] += count
+        delta[1] += stacks
+
+    def remove(self, item_id: int, where: str, count: int):
+        self.add(item_id, where, -count, -1)
+
+    def items(self) -> typing.Iterator[typing.Tuple[Key, typing.List[int]]]:
+        return ((k, v) for k, v in self._deltas.items() if any(v))
+
+
+def apply_deltas(deltas: Deltas):
+    """Update the totals by `deltas`, in the current transaction."""
+    changed = dict(deltas.items())
+    if not changed:
+        return
+
+    item_ids = {item_id for item_id, _ in changed}
+    stored = {
+        (row.item_id, row.location): row
+        for row in ItemLocationTotal.objects.filter(item_id__in=item_ids)
+    }
+    upserts = []
+    deletes = []
+    for (item_id, where), (total, stacks) in changed.items():
+        row = stored.get((item_id, where))
+        if row is not None:
+            total += row.total
+            stacks += row.stacks
+        if stacks > 0 and total >= 0:
+            upserts.append(
+                ItemLocationTotal(
+                    item_id=item_id, location=where, total=total, stacks=stacks
+                )
+            )
+        elif row is not None:
+            # Below zero only if the table has drifted; `check` reports that.
+            deletes.append(row.id)
+
+    if deletes:
+        ItemLocationTotal.objects.filter(id__in=deletes).delete()
+    if upserts:
+        ItemLocationTotal.objects.bulk_create(
+            upserts,
+            update_conflicts=True,
+            unique_fields=["item", "location"],
+            update_fields=["total", "stacks"],
+        )
+    _update_item_totals(item_ids)
+
+
+def _update_item_totals(item_ids: typing.Optional[typing.Set[int]] = None):
+    """Recompute `ItemTotal` of `item_ids`, or of all items, from the locations."""
+    locations = ItemLocationTotal.objects.all()
+    totals = ItemTotal.objects.all()
+    if item_ids is not None:
+        locations = locations.filter(item_id__in=item_ids)
+        totals = totals.filter(item_id__in=item_ids)
+    rows = [
+        ItemTotal(
+            item_id=row["item_id"],
+            total=row["sum_total"],
+            stacks=row["sum_stacks"],
+            locations=row["sum_locations"],
+        )
+        for row in locations.values("item_id")
+        .annotate(
+            sum_total=Sum("total"), sum_stacks=Sum("stacks"), sum_locations=Count("id")
+        )
+        .order_by()
+    ]
+    if item_ids is not None:
+        totals.exclude(item_id__in=[row.item_id for row in rows]).delete()
+    if rows:
+        ItemTotal.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["item"],
+            update_fields=["total", "stacks", "locations"],
+        )
+
+
+def _expected() -> typing.Dict[Key, typing.Tuple[int, int]]:
+    """(total, stacks) by item and location, aggregated from all slots."""
+    return {
+        (row["item_id"], location(row["character_id"], row["storage"])): (
+            row["sum_total"],
+            row["stacks"],
+        )
+        for row in ItemSlot.objects.values("item_id", "character_id", "storage")
+        .annotate(sum_total=Sum("count"), stacks=Count("id"))
+        .order_by()
+    }
+
+
+def check() -> typing.List[str]:
+    """Differences between the totals tables and the slots; empty if consistent."""
+    expected = _expected()
+    stored = {
+        (item_id, where): (total, stacks)
+        for item_id, where, total, stacks in ItemLocationTotal.objects.values_list(
+            "item_id", "location", "total", "stacks"
+        )
+    }
+    errors = [
+        f"item {item_id} in {where}: stored {stored.get((item_id, where))}, "
+        f"expected {expected.get((item_id, where))}"
+        for item_id, where in sorted(expected.keys() | stored.keys())
+        if expected.get((item_id, where)) != stored.get((item_id, where))
+    ]
+
+    by_item: typing.Dict[int, typing.Tuple[int, int, int]] = {}
+    for (item_id, _), (total, stacks) in expected.items():
+        t, s, n = by_item.get(item_id, (0, 0, 0))
+        by_item[item_id] = t + total, s + stacks, n + 1
+    stored_items = {
+        item_id: (total, stacks, locations)
+        for item_id, total, stacks, locations in ItemTotal.objects.values_list(
+            "item_id", "total", "stacks", "locations"
+        )
+    }
+    errors.extend(
+        f"item {item_id}: stored {stored_items.get(item_id)}, "
+        f"expected {by_item.get(item_id)}"
+        for item_id in sorted(by_item.keys() | stored_items.keys())
+        if by_item.get(item_id) != stored_items.get(item_id)
+    )
+    return errors
+
+
+def rebuild() -> int:
+    """Recompute the totals from all slots; returns the number of items."""
+    expected = _expected()
+    with atomic():
+        ItemLocationTotal.objects.all().delete()
+        ItemTotal.objects.all().delete()
+        ItemLocationTotal.objects.bulk_create(
+            (
+                ItemLocationTotal(item_id=item_id, location=where, total=t, stacks=s)
+                for (item_id, where), (t, s) in expected.items()
+            ),
+            batch_size=1000,
+        )
+        _update_item_totals()
+        data_version.bump()
+    return len({item_id for item_id, _ in expected})
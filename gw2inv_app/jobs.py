@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""Background sync jobs, with their progress persisted in `SyncJob`."""
+
+import datetime
+import hashlib
+import logging
+import threading
+import time
+import typing
+
+from django.conf import settings
+from django.db import IntegrityError, connections
+from django.db.transaction import atomic
+from django.utils.timezone import now
+
+from .fetcher import Progress, full_update
+from .models import SyncJob
+from .progress_hub import Snapshot, hub
+
+logger = logging.getLogger(__name__)
+
+# Name of the constraint allowing one queued or running job per account.
+ACTIVE_CONSTRAINT = "syncjob_one_active_per_account"
+# Attempts to queue a job while the active one keeps finishing in between.
+START_ATTEMPTS = 3
+
+
+class JobRunning(Exception):
+    """A sync of the account is already queued or running."""
+
+    def __init__(self, job: SyncJob):
+        super().__init__(f"Sync job {job.id} is already {job.status.lower()}")
+        self.job = job
+
+
+def account_key(api_key: typing.Optional[str] = None) -> str:
+    """Identifies the account of `api_key` (default: settings.GW2_API_KEY) without storing the key."""
+    if api_key is None:
+        api_key = settings.GW2_API_KEY
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+FINISHED = [SyncJob.StatusChoices.DONE, SyncJob.StatusChoices.FAILED]
+
+
+def snapshot(
+    id: int, status: str, target: int, current: int, errors: typing.List
+) -> Snapshot:
+    """Progress event data of a job."""
+    return {
+        "id": id,
+        "status": status,
+        "target": target,
+        "current": current,
+        "error_count": len(errors),
+    }
+
+
+class JobProgress(Progress):
+    """
+    Progress that is published to `progress_hub.hub` on every update, and
+    written to its job at most every `interval` seconds.
+
+    While the heartbeat runs, updates held back by `interval` are written
+    once it has passed, and the progress is written at least every
+    `heartbeat` seconds, so the job's `updated` shows its worker is alive.
+    """
+
+    def __init__(
+        self,
+        job_id: int,
+        interval: typing.Optional[float] = None,
+        clock: typing.Callable[[], float] = time.monotonic,
+        heartbeat: typing.Optional[float] = None,
+    ):
+        super().__init__(self._on_update)
+        self.job_id = job_id
+        self.status = SyncJob.StatusChoices.QUEUED
+        if interval is None:
+            interval = settings.GW2_JOB_PROGRESS_INTERVAL
+        if heartbeat is None:
+            heartbeat = settings.GW2_JOB_HEARTBEAT_SECONDS
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self._clock = clock
+        self._last_save: typing.Optional[float] = None
+        # Updates not written yet.
+        self._dirty = False
+        # Saves come from the job's thread and the heartbeat's.
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat_thread: typing.Optional[threading.Thread] = None
+
+    def add_error(self, e):
+        super().add_error(e)
+        self._on_update()
+
+    def _on_update(self):
+        self._publish()
+        if self._last_save is None or self._clock() - self._last_save >= self.interval:
+            self.save()
+        else:
+            self._dirty = True
+
+    def _publish(self):
+        hub.publish(
+            self.job_id,
+            snapshot(self.job_id, self.status, self.target, self.current, self.errors),
+            finished=self.status in FINISHED,
+        )
+
+    def save(self, **fields):
+        """Write the progress now, along with other job `fields`."""
+        with self._lock:
+            if "status" in fields:
+                self.status = fields["status"]
+                self._publish()
+            self._last_save = self._clock()
+            self._dirty = False
+            SyncJob.objects.filter(id=self.job_id).update(
+                target=self.target,
+                current=self.current,
+                errors=[str(e) for e in self.errors],
+                updated=now(),
+                **fields,
+            )
+
+    def beat(self):
+        """Write the progress if updates were held back, or the heartbeat is due."""
+        since = self._clock() - (self._last_save or 0.0)
+        if (self._dirty and since >= self.interval) or since >= self.heartbeat:
+            self.save()
+
+    def start_heartbeat(self):
+        """Call `beat` every `interval` seconds in a thread, until `stop_heartbeat`."""
+        self._stopped.clear()
+        self._heartbeat_thread = threading.Thread(
+            target=self._run_heartbeat,
+            name=f"sync-job-{self.job_id}-heartbeat",
+            daemon=True,
+        )
+        self._heartbeat_thread.start()
+
+    def stop_heartbeat(self):
+        self._stopped.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+
+    def _run_heartbeat(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    self.beat()
+                except Exception:
+                    # E.g. the database is locked; the next beat tries again.
+                    logger.warning(
+                        "Saving progress of job %s failed", self.job_id, exc_info=True
+                    )
+        finally:
+            connections.close_all()
+
+
+def start_sync(
+    run: typing.Callable[[Progress], None] = full_update,
+    account: typing.Optional[str] = None,
+) -> SyncJob:
+    """
+    Queue a job running `run` in a background thread and return it at once.
+
+    Raises `JobRunning` if a job of the account is queued or running. Jobs
+    whose progress has not been written for settings.GW2_JOB_STALE_SECONDS,
+    although running jobs write it every settings.GW2_JOB_HEARTBEAT_SECONDS,
+    have lost their worker, e.g. because its process was stopped, and are
+    marked failed first.
+    """
+    account = account or account_key()
+    _fail_stale_jobs(account)
+    for attempt in range(START_ATTEMPTS):
+        try:
+            with atomic():
+                job = SyncJob.objects.create(account=account)
+            break
+        except IntegrityError as e:
+            if not _is_active_job_conflict(e):
+                raise
+            active = SyncJob.objects.filter(
+                account=account, status__in=SyncJob.ACTIVE
+            ).first()
+            if active is not None:
+                raise JobRunning(active)
+            # Otherwise the active job just finished, try again.
+            if attempt == START_ATTEMPTS - 1:
+                raise
+
+    threading.Thread(
+        target=run_job, args=(job.id, run), name=f"sync-job-{job.id}", daemon=True
+    ).start()
+    return job
+
+
+def _is_active_job_conflict(error: IntegrityError) -> bool:
+    """Whether `error` violates the one active job per account constraint."""
+    message = str(error)
+    # PostgreSQL names the constraint, SQLite the column of its unique index.
+    return (
+        ACTIVE_CONSTRAINT in message
+        or message == f"UNIQUE constraint failed: {SyncJob._meta.db_table}.account"
+    )
+
+
+def _fail_stale_jobs(account: str):
+    stale = now() - datetime.timedelta(seconds=settings.GW2_JOB_STALE_SECONDS)
+    SyncJob.objects.filter(
+        account=account, status__in=SyncJob.ACTIVE, updated__lt=stale
+    ).update(status=SyncJob.StatusChoices.FAILED, finished=now())
+
+
+def run_job(job_id: int, run: typing.Callable[[Progress], None] = full_update):
+    """Run a queued job in the current thread."""
+    progress = JobProgress(job_id)
+    progress.save(status=SyncJob.StatusChoices.RUNNING, started=now())
+    progress.start_heartbeat()
+    try:
+        run(progress)
+    except Exception as e:
+        logger.exception("Sync job %s failed", job_id)
+        progress.stop_heartbeat()
+        progress.errors.append(repr(e))
+        progress.save(status=SyncJob.StatusChoices.FAILED, finished=now())
+    else:
+        progress.stop_heartbeat()
+        progress.save(status=SyncJob.StatusChoices.DONE, finished=now())
+    finally:
+        # Connections are per thread, and this thread ends here.
+        connections.close_all()
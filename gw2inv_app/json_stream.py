@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Incremental decoding of large JSON arrays."""
+
+import codecs
+import json
+import typing
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def iter_array(chunks: typing.Iterable[str]) -> typing.Iterator[typing.Any]:
+    """
+    Yield the elements of a top-level JSON array decoded from text `chunks`.
+
+    Only the element being decoded and the current chunk are kept in memory,
+    so memory use does not depend on the length of the array.
+    """
+    chunks = iter(chunks)
+    buf = ""
+    pos = 0
+    eof = False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        for chunk in chunks:
+            if chunk:
+                buf = buf[pos:] + chunk
+                pos = 0
+                return True
+        eof = True
+        return False
+
+    def skip(chars: str):
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf) or not more():
+                return
+
+    skip(_WHITESPACE)
+    if pos >= len(buf) or buf[pos] != "[":
+        raise ValueError("Expected a JSON array")
+    pos += 1
+
+    skip(_WHITESPACE)
+    if pos < len(buf) and buf[pos] == "]":
+        return
+
+    while True:
+        skip(_WHITESPACE)
+        try:
+            value, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if more():
+                continue
+            raise
+        if not eof and (end >= len(buf) or buf[end] not in _DELIMITERS):
+            # A number may continue in the next chunk.
+            more()
+            continue
+        yield value
+        pos = end
+
+        skip(_WHITESPACE)
+        if pos >= len(buf):
+            raise ValueError("Unterminated JSON array")
+        if buf[pos] == "]":
+            return
+        if buf[pos] != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {buf[pos]!r}")
+        pos += 1
+
+
+def iter_array_bytes(
+    chunks: typing.Iterable[bytes], encoding: str = "utf-8"
+) -> typing.Iterator[typing.Any]:
+    """`iter_array` for byte chunks, e.g. from `requests.Response.iter_content`."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    return iter_array(decoder.decode(chunk) for chunk in chunks)
+
+
+def iter_file_array(
+    f: typing.TextIO, chunk_size: int = 64 * 1024
+) -> typing.Iterator[typing.Any]:
+    """`iter_array` over a text file."""
+    return iter_array(iter(lambda: f.read(chunk_size), ""))
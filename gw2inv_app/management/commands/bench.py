@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gw2inv_app import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the benchmark suite on a synthetic account of 60 characters, a full "
+        "bank and 10k items. Database cases run in transactions that are rolled "
+        "back. Results can be saved as JSON and compared with a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--case",
+            action="append",
+            default=[],
+            help="Only run cases whose name contains this; may be repeated.",
+        )
+        parser.add_argument("--output", help="Save the results to this JSON file.")
+        parser.add_argument("--compare", help="Results JSON file to compare with.")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.2,
+            help="Fail when a case is this much slower than in --compare (0.2: 20%%).",
+        )
+
+    def print(self, *args):
+        self.stdout.write(" ".join(str(a) for a in args))
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = bench.load(options["compare"])
+            except (OSError, ValueError) as e:
+                raise CommandError(e)
+
+        fixtures = bench.make_fixtures(options["seed"])
+        with tempfile.TemporaryDirectory() as directory:
+            cases = [
+                case
+                for case in bench.make_cases(fixtures, directory)
+                if not options["case"] or any(c in case.name for c in options["case"])
+            ]
+            if not cases:
+                raise CommandError("No case matches.")
+            document = bench.run_cases(
+                cases,
+                options["repeat"],
+                lambda name, result: self.print(
+                    f"{name:<32} {result['median'] * 1000:10.1f} ms",
+                    f"(min {result['min'] * 1000:.1f} ms)",
+                ),
+            )
+
+        if options["output"]:
+            bench.save(options["output"], document)
+            self.print("Saved to", options["output"])
+        if baseline is not None:
+            self._compare(baseline, document, options["threshold"])
+
+    def _compare(self, baseline, document, threshold: float):
+        self.print(f"Compared with {baseline['commit'] or baseline['created']}:")
+        if baseline["environment"] != document["environment"]:
+            self.print("  Warning: environments differ:", baseline["environment"])
+        slower = []
+        for c in bench.compare(baseline, document):
+            flag = ""
+            if c.ratio > 1 + threshold:
+                slower.append(c.name)
+                flag = " SLOWER"
+            self.print(
+                f"  {c.name:<32} {c.baseline * 1000:10.1f} -> {c.current * 1000:10.1f} ms",
+                f"{(c.ratio - 1) * 100:+6.1f}%{flag}",
+            )
+        if slower:
+            raise CommandError(
+                f"{len(slower)} cases are more than {threshold:.0%} slower: "
+                + ", ".join(slower)
+            )
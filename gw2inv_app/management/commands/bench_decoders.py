@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from marshmallow import EXCLUDE
+
+from gw2inv_app.dto import BankSchema
+from gw2inv_app.dto.fast import bank_decoder
+
+
+def make_bank(slots: int, seed: int = 0):
+    """Synthetic v2/account/bank response with roughly a third of the slots empty."""
+    rnd = random.Random(seed)
+    bank = []
+    for _ in range(slots):
+        if rnd.random() < 0.3:
+            bank.append(None)
+            continue
+        slot = {"id": rnd.randint(1, 100000), "count": rnd.randint(1, 250)}
+        if rnd.random() < 0.3:
+            slot["binding"] = "Account"
+        if rnd.random() < 0.1:
+            slot["upgrades"] = [rnd.randint(1, 100000)]
+            slot["upgrade_slot_indices"] = [0]
+            slot["stats"] = {"id": 1, "attributes": {"Power": 100}}
+        bank.append(slot)
+    return bank
+
+
+class Command(BaseCommand):
+    help = "Compare marshmallow and compiled decoders on a synthetic bank."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--slots", type=int, default=10000)
+        parser.add_argument("--repeat", type=int, default=5)
+
+    def print(self, *args):
+        self.stdout.write(" ".join(str(a) for a in args))
+
+    def _time(self, fn, repeat: int) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def handle(self, *args, **options):
+        bank = make_bank(options["slots"])
+        schema = BankSchema(many=True)
+
+        expected = schema.load(bank, unknown=EXCLUDE)
+        actual = [r.to_dict() for r in bank_decoder.decode(bank)]
+        if expected != actual:
+            self.print("Decoders disagree!")
+            return
+
+        slow = self._time(lambda: schema.load(bank, unknown=EXCLUDE), options["repeat"])
+        fast = self._time(lambda: bank_decoder.decode(bank), options["repeat"])
+        self.print(f"{options['slots']} slots, best of {options['repeat']}:")
+        self.print(f"marshmallow: {slow * 1000:8.1f} ms")
+        self.print(f"compiled:    {fast * 1000:8.1f} ms ({slow / fast:.1f}x)")
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.transaction import atomic, set_rollback
+from django.utils.timezone import now
+
+from gw2inv_app.models import PendingData
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure PendingData queue operations with a large history of completed rows. "
+        "The rows are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--history", type=int, default=1_000_000)
+        parser.add_argument("--open", type=int, default=1000)
+        parser.add_argument("--claim", type=int, default=100)
+
+    def print(self, *args):
+        self.stdout.write(" ".join(str(a) for a in args))
+
+    def _time(self, label: str, fn):
+        start = time.perf_counter()
+        result = fn()
+        self.print(f"{label:<40} {(time.perf_counter() - start) * 1000:10.1f} ms")
+        return result
+
+    def _plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                return "; ".join(str(row[-1]) for row in cursor.fetchall())
+            cursor.execute("EXPLAIN " + sql, params)
+            return "; ".join(str(row[0]) for row in cursor.fetchall())
+
+    def handle(self, *args, **options):
+        with atomic():
+            self._run(options)
+            # Leave no benchmark data behind.
+            set_rollback(True)
+
+    def _run(self, options):
+        target = PendingData.TargetChoices.CHARACTER
+        completed = now() - datetime.timedelta(days=30)
+
+        def fill():
+            batch = 50_000
+            for start in range(0, options["history"], batch):
+                PendingData.objects.bulk_create(
+                    PendingData(
+                        target=target, api_id=f"old{i}", json="", completed=completed
+                    )
+                    for i in range(start, min(start + batch, options["history"]))
+                )
+            PendingData.objects.bulk_create(
+                PendingData(target=target, api_id=f"new{i}", json="")
+                for i in range(options["open"])
+            )
+
+        self._time(f"insert {options['history']} + {options['open']} rows", fill)
+
+        legacy = PendingData.objects.filter(
+            target=target,
+            completed__isnull=True,
+            failed_count__lt=PendingData.FAILED_REPEAT_COUNT,
+        ).order_by("id")
+        self.print("plan:", self._plan(legacy))
+        self._time("select all open rows", lambda: len(list(legacy)))
+
+        claimed = 0
+        while True:
+            rows = self._time(
+                f"claim {options['claim']} rows",
+                lambda: PendingData.objects.claim("bench", options["claim"], [target]),
+            )
+            if not rows:
+                break
+            claimed += len(rows)
+            PendingData.objects.filter(id__in=[r.id for r in rows]).update(
+                completed=now()
+            )
+        self.print("claimed", claimed, "rows")
+
+        deleted = self._time(
+            "compact rows older than a week",
+            lambda: PendingData.objects.compact(datetime.timedelta(days=7)),
+        )
+        self.print("deleted", deleted, "rows")
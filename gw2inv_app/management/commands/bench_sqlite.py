@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.db.transaction import atomic
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+
+from gw2inv_app.models import Character, Item
+from gw2inv_app.views import index_context
+
+ALIAS = "bench_sqlite"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure item write throughput of a sync, and index page latency while it "
+        "runs, with and without the SQLite performance profile. The sync runs in "
+        "another process. Uses a temporary database next to the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batches", type=int, default=200)
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--characters", type=int, default=60)
+
+    def print(self, *args):
+        self.stdout.write(" ".join(str(a) for a in args))
+
+    def handle(self, *args, **options):
+        if connections["default"].vendor != "sqlite":
+            raise CommandError("The default database is not SQLite.")
+
+        directory = os.path.dirname(connections["default"].settings_dict["NAME"])
+        for profile in (False, True):
+            # A timeout of 0 disables the fragment cache: every load reads
+            # the characters.
+            with tempfile.TemporaryDirectory(dir=directory) as tmp, override_settings(
+                GW2_SQLITE_PROFILE=profile, GW2_FRAGMENT_CACHE_TIMEOUT=0
+            ):
+                connections.settings[ALIAS] = dict(
+                    connections["default"].settings_dict,
+                    NAME=os.path.join(tmp, "bench.sqlite3"),
+                )
+                try:
+                    self._run(profile, options)
+                finally:
+                    connections[ALIAS].close()
+                    del connections[ALIAS]
+                    del connections.settings[ALIAS]
+
+    def _run(self, profile: bool, options):
+        call_command("migrate", database=ALIAS, verbosity=0)
+        Character.objects.using(ALIAS).bulk_create(
+            Character(name=f"Character {i}", race="Norn", profession="Thief", level=80)
+            for i in range(options["characters"])
+        )
+
+        # The forked writer must not share the connections of this process.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        writer = context.Process(target=_write, args=(options, results))
+        request = RequestFactory().get("/")
+        latencies = []
+        errors = 0
+        writer.start()
+        while writer.is_alive() and results.empty():
+            start = time.perf_counter()
+            try:
+                render_to_string(
+                    "gw2inv_app/index.html",
+                    index_context(Character.objects.using(ALIAS).all()),
+                    request,
+                )
+            except OperationalError:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+        writes = results.get()
+        writer.join()
+
+        latencies.sort()
+        self.print(f"profile {'on' if profile else 'off'}:")
+        self.print(
+            f"  writes {writes['rows']} rows in {writes['seconds']:.2f} s,",
+            f"{writes['rows'] / writes['seconds']:.0f} rows/s",
+        )
+        self.print(
+            f"  index page: {len(latencies)} loads,",
+            f"median {statistics.median(latencies):.2f} ms,",
+            f"p95 {latencies[int(len(latencies) * 0.95)]:.2f} ms,",
+            f"max {latencies[-1]:.2f} ms, {errors} errors",
+        )
+
+
+def _write(options, results: multiprocessing.Queue):
+    size = options["batch_size"]
+    start = time.perf_counter()
+    for batch in range(options["batches"]):
+        # Like BatchWriter.flush: one transaction per batch.
+        with atomic(using=ALIAS):
+            Item.objects.using(ALIAS).bulk_create(
+                Item(
+                    id=batch * size + i,
+                    name="Item",
+                    chat_link="[&AgEAAAA=]",
+                    description="",
+                    type=Item.Type.TROPHY,
+                    rarity=Item.Rarity.BASIC,
+                    flags=[Item.Flags.NO_SELL],
+                    level=0,
+                )
+                for i in range(size)
+            )
+    connections[ALIAS].close()
+    results.put(
+        {"rows": options["batches"] * size, "seconds": time.perf_counter() - start}
+    )
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from gw2inv_app.consolidation import consolidate, load_slots
+from gw2inv_app.models import Item, ItemSlot
+
+
+class Command(BaseCommand):
+    help = "Compute the moves merging partial stacks across the whole account."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--moves", type=int, default=20, help="Number of moves to list."
+        )
+
+    def print(self, *args):
+        self.stdout.write(" ".join(str(a) for a in args))
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        slots = load_slots()
+        loaded = time.perf_counter()
+        result = consolidate(slots)
+        done = time.perf_counter()
+
+        self.print(
+            f"{len(slots.slot_id)} slots loaded in {(loaded - start) * 1000:.1f} ms,",
+            f"consolidated in {(done - loaded) * 1000:.1f} ms",
+        )
+        self.print(
+            f"{len(result.count)} moves free {len(result.freed)} slots",
+            f"of {len(set(result.item_id.tolist()))} items",
+        )
+
+        moves = list(result.moves())[: options["moves"]]
+        slot_ids = {s for source, target, _, _ in moves for s in (source, target)}
+        where = {
+            slot.id: _location(slot)
+            for slot in ItemSlot.objects.filter(id__in=slot_ids).select_related(
+                "character"
+            )
+        }
+        names = dict(
+            Item.objects.filter(id__in={m[2] for m in moves}).values_list("id", "name")
+        )
+        for source, target, item_id, count in moves:
+            self.print(
+                f"  {count:>3}x {names.get(item_id, item_id)}:",
+                where[source],
+                "->",
+                where[target],
+            )
+
+
+def _location(slot: ItemSlot) -> str:
+    if slot.character is not None:
+        return f"{slot.character.name} bag {slot.bag} slot {slot.index}"
+    return f"{slot.get_storage_display()} slot {slot.index}"
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from gw2inv_app import fetcher
+from gw2inv_app.http_metrics import prometheus, registry
+
+SYNCS = {
+    "full": fetcher.full_update,
+    "characters": fetcher.update_characters_concurrent,
+    "inventories": fetcher.update_character_inventory,
+    "storage": fetcher.update_account_storage,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run a sync and report its GW2 API requests per endpoint: statuses, "
+        "latency, bytes, rate limiter waits and cache hits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sync", choices=SYNCS.keys(), default="full")
+        parser.add_argument(
+            "--format", choices=["table", "json", "prometheus"], default="table"
+        )
+
+    def print(self, *args):
+        self.stdout.write(" ".join(str(a) for a in args))
+
+    def handle(self, *args, **options):
+        registry.reset()
+        start = time.perf_counter()
+        SYNCS[options["sync"]](fetcher.Progress(lambda: None))
+        elapsed = time.perf_counter() - start
+        snapshot = registry.snapshot()
+
+        if options["format"] == "json":
+            self.print(
+                json.dumps({"seconds": elapsed, "endpoints": snapshot}, indent=4)
+            )
+            return
+        if options["format"] == "prometheus":
+            self.stdout.write(prometheus(snapshot), ending="")
+            return
+
+        self.print(
+            f"{'endpoint':<34} {'requests':>8} {'statuses':<16} {'mean ms':>8}",
+            f"{'total s':>8} {'limiter s':>9} {'KiB':>9} {'cache':>12}",
+        )
+        for family, m in snapshot.items():
+            statuses = ",".join(f"{k}:{v}" for k, v in m["statuses"].items())
+            mean = m["latency"]["sum"] / m["requests"] * 1000 if m["requests"] else 0
+            cache = "/".join(str(v) for v in m["cache"].values())
+            self.print(
+                f"{family:<34} {m['requests']:>8} {statuses:<16} {mean:>8.1f}",
+                f"{m['latency']['sum']:>8.2f} {m['limiter_wait']:>9.2f}",
+                f"{m['bytes'] / 1024:>9.1f} {cache:>12}",
+            )
+        waiting = sum(m["latency"]["sum"] for m in snapshot.values())
+        limited = sum(m["limiter_wait"] for m in snapshot.values())
+        self.print(
+            f"Sync took {elapsed:.2f} s; requests {waiting:.2f} s and rate limiter",
+            f"{limited:.2f} s, summed over concurrent requests. Cache is",
+            "hits/revalidated/misses.",
+        )
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gw2inv_app.catalogue import import_items, open_dump, read_records
+
+
+class Command(BaseCommand):
+    help = "Import item catalogue from a local dump (JSON array or NDJSON, optionally gzipped)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=str, metavar="FILE_PATH")
+        parser.add_argument(
+            "--workers",
+            "-w",
+            type=int,
+            default=None,
+            help="Number of validation processes. Default: number of CPUs.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Records validated per worker task.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Items per bulk insert.",
+        )
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            default=False,
+            help="Update existing items instead of skipping them.",
+        )
+
+    def print(self, *args):
+        self.stdout.write(" ".join(str(a) for a in args))
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def on_progress(done, errors):
+            rate = done / (time.perf_counter() - start)
+            self.stdout.write(
+                f"\r{done} items, {errors} errors, {rate:.0f} items/s", ending=""
+            )
+
+        try:
+            f = open_dump(options["path"])
+        except OSError as e:
+            raise CommandError(e)
+
+        with f:
+            written, errors = import_items(
+                read_records(f),
+                workers=options["workers"],
+                chunk_size=options["chunk_size"],
+                batch_size=options["batch_size"],
+                update=options["update"],
+                on_progress=on_progress,
+            )
+
+        elapsed = time.perf_counter() - start
+        self.print()
+        for item_id, message in errors.items():
+            self.print("Invalid item", item_id, message)
+        self.print(
+            f"Imported {written} items in {elapsed:.1f} s "
+            f"({written / elapsed:.0f} items/s), {len(errors)} invalid."
+        )
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gw2inv_app import item_totals
+
+
+class Command(BaseCommand):
+    help = "Check the maintained item totals against the item slots, or rebuild them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute the totals from the item slots.",
+        )
+
+    def print(self, *args):
+        self.stdout.write(" ".join(str(a) for a in args))
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            self.print("Rebuilt totals of", item_totals.rebuild(), "items")
+            return
+
+        errors = item_totals.check()
+        for error in errors:
+            self.print(error)
+        if errors:
+            raise CommandError(
+                f"{len(errors)} totals differ from the item slots, "
+                "run with --rebuild to fix them"
+            )
+        self.print("Item totals match the item slots")
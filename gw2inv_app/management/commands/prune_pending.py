@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from gw2inv_app.models import PendingData
+
+
+class Command(BaseCommand):
+    help = "Delete completed and permanently failed PendingData rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=float,
+            default=7,
+            help="Keep rows finished within this many days. Default: 7.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = PendingData.objects.compact(datetime.timedelta(days=options["days"]))
+        self.stdout.write(f"Deleted {deleted} rows.")
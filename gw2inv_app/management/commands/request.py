@@ -10,6 +10,8 @@ from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
 from gw2inv_app import dto
+from gw2inv_app.json_stream import iter_file_array
+from gw2inv_app.replay import fixture_name
 
 TYPES = {
     "bank": dto.BankSchema,
@@ -23,7 +25,7 @@ TYPES = {
 class Command(BaseCommand):
     help = "Do a request to GW2 API."
 
-    requires_system_checks = False
+    requires_system_checks = []
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -57,6 +59,13 @@ class Command(BaseCommand):
             default=False,
             help="Is the response a list? Affects only --type",
         )
+        parser.add_argument(
+            "--stream",
+            "-s",
+            action="store_true",
+            default=False,
+            help="With --load: decode a list file one element at a time. Implies --multi.",
+        )
         parser.add_argument(
             "--items",
             action="store_true",
@@ -79,7 +88,7 @@ class Command(BaseCommand):
         if not path.startswith("v2/"):
             raise CommandError("Invalid request path")
 
-        fpath = "cache/" + path.replace("/", "_") + ".json"
+        fpath = os.path.join("cache", fixture_name(path))
         if not os.path.exists("cache"):
             os.mkdir("cache")
 
@@ -98,17 +107,30 @@ class Command(BaseCommand):
 
         if dtype:
             multi = options["multi"]
-            obj = dtype().load(obj, many=multi, unknown="EXCLUDE")
+            obj = dtype().load(obj, many=multi, unknown=marshmallow.EXCLUDE)
         self.print(obj)
 
     def _load(self, path, dtype: typing.Type[marshmallow.Schema], options):
+        if options["stream"]:
+            return self._load_stream(path, dtype)
+
         multi = options["multi"]
         with open(path, "rt") as f:
             data = json.load(f)
 
-        obj = dtype().load(data, many=multi, unknown="EXCLUDE")
+        obj = dtype().load(data, many=multi, unknown=marshmallow.EXCLUDE)
         if options["items"]:
             inventory = set(dto.CharacterSchema.get_item_id_list(obj))
             self.print("length: " + str(len(inventory)), inventory)
         else:
             self.print(obj)
+
+    def _load_stream(
+        self, path, dtype: typing.Optional[typing.Type[marshmallow.Schema]]
+    ):
+        schema = dtype() if dtype else None
+        with open(path, "rt") as f:
+            for obj in iter_file_array(f):
+                if obj is not None and schema is not None:
+                    obj = schema.load(obj, unknown=marshmallow.EXCLUDE)
+                self.print(obj)
@@ -0,0 +1,39 @@
+# Generated by Django 4.1.5 on 2026-10-17 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pendingdata",
+            name="lease_owner",
+            field=models.CharField(blank=True, default="", max_length=64),
+        ),
+        migrations.AddField(
+            model_name="pendingdata",
+            name="leased_until",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name="pendingdata",
+            index=models.Index(
+                condition=models.Q(("completed__isnull", True)),
+                fields=["target", "id"],
+                name="pendingdata_open_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="pendingdata",
+            index=models.Index(
+                condition=models.Q(("completed__isnull", False)),
+                fields=["completed"],
+                name="pendingdata_completed_idx",
+            ),
+        ),
+    ]
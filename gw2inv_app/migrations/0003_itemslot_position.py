@@ -0,0 +1,29 @@
+# Generated by Django 4.1.5 on 2026-10-17 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0002_pendingdata_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itemslot",
+            name="bag",
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="itemslot",
+            name="index",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name="itemslot",
+            constraint=models.UniqueConstraint(
+                fields=("character", "bag", "index"), name="itemslot_position_unique"
+            ),
+        ),
+    ]
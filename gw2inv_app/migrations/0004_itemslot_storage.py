@@ -0,0 +1,34 @@
+# Generated by Django 4.1.5 on 2026-10-17 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0003_itemslot_position"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itemslot",
+            name="storage",
+            field=models.CharField(
+                choices=[
+                    ("Inventory", "Character inventory"),
+                    ("Bank", "Account bank"),
+                    ("Materials", "Material storage"),
+                ],
+                default="Inventory",
+                max_length=16,
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="itemslot",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("character__isnull", True)),
+                fields=("storage", "index"),
+                name="itemslot_account_position_unique",
+            ),
+        ),
+    ]
@@ -0,0 +1,112 @@
+# Converts Item.flags and Item.restrictions from comma-separated strings to bitmasks.
+
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+import gw2inv_app.models
+
+FIELDS = ["flags", "restrictions"]
+
+
+def strings_to_bits(apps, schema_editor):
+    Item = apps.get_model("gw2inv_app", "Item")
+    db_alias = schema_editor.connection.alias
+    for field in FIELDS:
+        # Few distinct combinations; one UPDATE for each. The stored strings
+        # are compared as is, as FlagCharField would re-sort them.
+        items = Item.objects.using(db_alias).annotate(
+            raw=Cast(field, models.TextField())
+        )
+        for value in items.values_list("raw", flat=True).distinct():
+            items.filter(raw=value).update(**{field + "_bits": value})
+
+
+def bits_to_strings(apps, schema_editor):
+    Item = apps.get_model("gw2inv_app", "Item")
+    items = Item.objects.using(schema_editor.connection.alias)
+    for field in FIELDS:
+        for value in items.values_list(field + "_bits", flat=True).distinct():
+            items.filter(**{field + "_bits": value}).update(**{field: sorted(value)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0004_itemslot_storage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="item",
+            name="flags_bits",
+            field=gw2inv_app.models.FlagBitField(
+                default=frozenset,
+                flags=[
+                    "AccountBindOnUse",
+                    "AccountBound",
+                    "Attuned",
+                    "BulkConsume",
+                    "DeleteWarning",
+                    "HideSuffix",
+                    "Infused",
+                    "MonsterOnly",
+                    "NoMysticForge",
+                    "NoSalvage",
+                    "NoSell",
+                    "NotUpgradeable",
+                    "NoUnderwater",
+                    "SoulbindOnAcquire",
+                    "SoulBindOnUse",
+                    "Tonic",
+                    "Unique",
+                ],
+            ),
+        ),
+        migrations.AddField(
+            model_name="item",
+            name="restrictions_bits",
+            field=gw2inv_app.models.FlagBitField(
+                default=frozenset,
+                flags=[
+                    "Asura",
+                    "Charr",
+                    "Female",
+                    "Human",
+                    "Norn",
+                    "Sylvari",
+                    "Elementalist",
+                    "Engineer",
+                    "Guardian",
+                    "Mesmer",
+                    "Necromancer",
+                    "Ranger",
+                    "Thief",
+                    "Warrior",
+                ],
+            ),
+        ),
+        migrations.RunPython(strings_to_bits, bits_to_strings),
+        # Default for the columns added back when migrating backwards.
+        migrations.AlterField(
+            model_name="item",
+            name="flags",
+            field=gw2inv_app.models.FlagCharField(
+                choices=[], default="", max_length=255
+            ),
+        ),
+        migrations.AlterField(
+            model_name="item",
+            name="restrictions",
+            field=gw2inv_app.models.FlagCharField(
+                choices=[], default="", max_length=255
+            ),
+        ),
+        migrations.RemoveField(model_name="item", name="flags"),
+        migrations.RemoveField(model_name="item", name="restrictions"),
+        migrations.RenameField(
+            model_name="item", old_name="flags_bits", new_name="flags"
+        ),
+        migrations.RenameField(
+            model_name="item", old_name="restrictions_bits", new_name="restrictions"
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.5 on 2026-10-17 15:06
+
+from django.db import migrations
+
+import gw2inv_app.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0005_item_flag_bits"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itemslot",
+            name="infusion_ids",
+            field=gw2inv_app.models.PackedIdsField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="itemslot",
+            name="upgrade_ids",
+            field=gw2inv_app.models.PackedIdsField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,108 @@
+# Generated by Django 4.1.5 on 2026-10-17 15:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_totals(apps, schema_editor):
+    # Existing slots; from here on, the slot sync maintains the totals.
+    ItemSlot = apps.get_model("gw2inv_app", "ItemSlot")
+    ItemLocationTotal = apps.get_model("gw2inv_app", "ItemLocationTotal")
+    ItemTotal = apps.get_model("gw2inv_app", "ItemTotal")
+    db_alias = schema_editor.connection.alias
+    locations = [
+        ItemLocationTotal(
+            item_id=row["item_id"],
+            location=(
+                f"character:{row['character_id']}"
+                if row["character_id"] is not None
+                else row["storage"]
+            ),
+            total=row["sum_total"],
+            stacks=row["sum_stacks"],
+        )
+        for row in ItemSlot.objects.using(db_alias)
+        .values("item_id", "character_id", "storage")
+        .annotate(sum_total=models.Sum("count"), sum_stacks=models.Count("id"))
+        .order_by()
+    ]
+    ItemLocationTotal.objects.using(db_alias).bulk_create(locations, batch_size=1000)
+    ItemTotal.objects.using(db_alias).bulk_create(
+        (
+            ItemTotal(
+                item_id=row["item_id"],
+                total=row["sum_total"],
+                stacks=row["sum_stacks"],
+                locations=row["sum_locations"],
+            )
+            for row in ItemLocationTotal.objects.using(db_alias)
+            .values("item_id")
+            .annotate(
+                sum_total=models.Sum("total"),
+                sum_stacks=models.Sum("stacks"),
+                sum_locations=models.Count("id"),
+            )
+            .order_by()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0007_syncjob"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ItemTotal",
+            fields=[
+                (
+                    "item",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="total",
+                        serialize=False,
+                        to="gw2inv_app.item",
+                    ),
+                ),
+                ("total", models.PositiveBigIntegerField()),
+                ("stacks", models.PositiveIntegerField()),
+                ("locations", models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="ItemLocationTotal",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("location", models.CharField(max_length=32)),
+                ("total", models.PositiveBigIntegerField()),
+                ("stacks", models.PositiveIntegerField()),
+                (
+                    "item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="location_totals",
+                        to="gw2inv_app.item",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="itemlocationtotal",
+            constraint=models.UniqueConstraint(
+                fields=("item", "location"), name="itemlocationtotal_unique"
+            ),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.5 on 2026-10-17 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0009_data_version"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                condition=models.Q(("flags__has", "AccountBound")),
+                fields=["id"],
+                name="item_account_bound_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="item",
+            index=models.Index(
+                condition=models.Q(("flags__has", "NoSell")),
+                fields=["id"],
+                name="item_no_sell_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.5 on 2026-10-17 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0010_item_flag_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="pendingdata",
+            name="target",
+            field=models.CharField(
+                choices=[
+                    ("Character", "Character"),
+                    ("Item", "Item"),
+                    ("Slot", "Slot"),
+                    ("Storage", "Storage"),
+                ],
+                max_length=32,
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.1.5 on 2026-10-17 16:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_index(apps, schema_editor):
+    # Existing packed slots; from here on, the slot sync maintains the index.
+    ItemSlot = apps.get_model("gw2inv_app", "ItemSlot")
+    SlotUpgrade = apps.get_model("gw2inv_app", "SlotUpgrade")
+    db_alias = schema_editor.connection.alias
+    slots = ItemSlot.objects.using(db_alias).exclude(upgrade_ids=[], infusion_ids=[])
+    SlotUpgrade.objects.using(db_alias).bulk_create(
+        (
+            SlotUpgrade(slot_id=slot_id, item_id=item_id)
+            for slot_id, upgrades, infusions in slots.values_list(
+                "id", "upgrade_ids", "infusion_ids"
+            )
+            for item_id in {*upgrades, *infusions}
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("gw2inv_app", "0011_pendingdata_storage_target"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlotUpgrade",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="gw2inv_app.item",
+                    ),
+                ),
+                (
+                    "slot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="upgrade_refs",
+                        to="gw2inv_app.itemslot",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="slotupgrade",
+            constraint=models.UniqueConstraint(
+                fields=("item", "slot"), name="slotupgrade_item_slot_unique"
+            ),
+        ),
+        migrations.RunPython(fill_index, migrations.RunPython.noop),
+    ]
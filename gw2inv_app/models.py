@@ -1,8 +1,13 @@
 # -*- coding: utf-8 -*-
 
+import datetime
 import typing
 
+from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.db.transaction import atomic
+from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
 
@@ -44,6 +49,106 @@ class FlagCharField(models.CharField):
         return value
 
 
+class FlagBitField(models.BigIntegerField):
+    """
+    Set of flags stored as a bitmask, bit `i` standing for the `i`-th of `flags`.
+
+    The bit of a flag is its position, so new flags must only be appended.
+    Values load as frozensets; filter with `field__has=flag` or a list of flags.
+    """
+
+    def __init__(self, flags=(), *args, **kwargs):
+        # A TextChoices class, or its values.
+        self.flags = list(getattr(flags, "values", flags))
+        self._bits = {flag: 1 << i for i, flag in enumerate(self.flags)}
+        self._sets: typing.Dict[int, typing.FrozenSet[str]] = {}
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["flags"] = self.flags
+        return name, path, args, kwargs
+
+    def decode(self, mask: int) -> typing.FrozenSet[str]:
+        # There are few distinct combinations, so sets are shared between rows.
+        result = self._sets.get(mask)
+        if result is None:
+            result = frozenset(f for f, bit in self._bits.items() if mask & bit)
+            self._sets[mask] = result
+        return result
+
+    def encode(self, flags: typing.Iterable[str]) -> int:
+        mask = 0
+        for flag in flags:
+            if flag:  # FlagCharField stores no flags as [""]
+                try:
+                    mask |= self._bits[flag]
+                except KeyError:
+                    raise ValueError(f"Unknown flag {flag!r} for {self.name}")
+        return mask
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return self.decode(value)
+
+    def to_python(self, value):
+        if value is None:
+            return None
+        if isinstance(value, int):
+            return self.decode(value)
+        if isinstance(value, str):
+            value = value.split(",")
+        return self.decode(self.encode(value))
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str):
+            value = value.split(",")
+        return self.encode(value)
+
+    def value_to_string(self, obj):
+        value = self.value_from_object(obj)
+        return None if value is None else ",".join(sorted(self.to_python(value)))
+
+
+@FlagBitField.register_lookup
+class HasFlags(models.Lookup):
+    """
+    All given flags are set: `(field & bit) = bit` for the bit of each flag.
+
+    The bits are inlined rather than passed as parameters, and tested one by
+    one, so that SQLite can use a partial index with `field__has=flag` as
+    condition for any query testing that flag, alone or with others.
+    """
+
+    lookup_name = "has"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        if hasattr(self.rhs, "as_sql"):
+            rhs, rhs_params = self.process_rhs(compiler, connection)
+            return f"({lhs} & {rhs}) = {rhs}", (*lhs_params, *rhs_params, *rhs_params)
+        # An int from FlagBitField.get_prep_value, safe to inline.
+        bits = [1 << i for i in range(int(self.rhs).bit_length()) if self.rhs >> i & 1]
+        if not bits:
+            return "1 = 1", ()
+        sql = " AND ".join(f"({lhs} & {bit}) = {bit}" for bit in bits)
+        return f"({sql})", lhs_params * len(bits)
+
+
+class PackedIdsField(models.JSONField):
+    """Ordered list of ids, stored as a JSON array."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("default", list)
+        kwargs.setdefault("blank", True)
+        super().__init__(*args, **kwargs)
+
+
 class Race(models.TextChoices):
     ASURA = "Asura", _("Asura")
     CHARR = "Charr", _("Charr")
@@ -148,26 +253,66 @@ class Item(models.Model):
     description = models.TextField()
     type = models.CharField(max_length=64, choices=Type.choices)
     rarity = models.CharField(max_length=64, choices=Rarity.choices)
-    flags = FlagCharField(
-        max_length=255, choices=Flags.choices
-    )  # Comma-separated list of Flags
+    flags = FlagBitField(Flags, default=frozenset)
     level = models.PositiveSmallIntegerField()
-    restrictions = FlagCharField(
-        max_length=255, choices=Restriction.choices
-    )  # Comma-separated list of Restriction
+    restrictions = FlagBitField(Restriction, default=frozenset)
+
+    class Meta:
+        indexes = [
+            # Items by the flags that decide what can be sold or moved.
+            models.Index(
+                fields=["id"],
+                condition=Q(flags__has="AccountBound"),
+                name="item_account_bound_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=Q(flags__has="NoSell"),
+                name="item_no_sell_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.name}, level {self.level} {self.rarity} {self.type}"
 
 
+class ItemSlotQuerySet(models.QuerySet):
+    def for_display(self):
+        """
+        Slots with their item, its total and the soulbound character joined,
+        and M2M upgrades and infusions prefetched. Call `resolve_upgrades` on
+        the fetched slots to fill `upgrade_items` and `infusion_items`.
+        """
+        slots = self.select_related("item", "item__total", "bound_to")
+        if not settings.GW2_PACKED_UPGRADES:
+            slots = slots.prefetch_related("upgrades", "infusions")
+        return slots
+
+    def with_upgrade(self, item_id: int):
+        """Slots with the item as upgrade or infusion, looked up by index."""
+        if settings.GW2_PACKED_UPGRADES:
+            return self.filter(upgrade_refs__item=item_id)
+        return self.filter(Q(upgrades=item_id) | Q(infusions=item_id)).distinct()
+
+
 class ItemSlot(models.Model):
     class BindingChoices(models.TextChoices):
         ACCOUNT = "Account", _("Account bound")
         CHARACTER = "Character", _("Soulbound to {}")
 
+    class StorageChoices(models.TextChoices):
+        INVENTORY = "Inventory", _("Character inventory")
+        BANK = "Bank", _("Account bank")
+        MATERIALS = "Materials", _("Material storage")
+
     character = models.ForeignKey(
         Character, null=True, on_delete=models.CASCADE, related_name="slots"
     )
+    storage = models.CharField(
+        max_length=16, choices=StorageChoices.choices, default=StorageChoices.INVENTORY
+    )
+    bag = models.PositiveSmallIntegerField(null=True, blank=True)
+    index = models.PositiveIntegerField(default=0)
     item = models.ForeignKey(Item, on_delete=models.RESTRICT, related_name="in_slots")
     count = models.PositiveIntegerField(default=1)
     charges = models.PositiveIntegerField(null=True, blank=True)
@@ -180,25 +325,172 @@ class ItemSlot(models.Model):
     )  # db_constraint=False ?
     upgrades = models.ManyToManyField(Item, related_name="as_upgrades")
     infusions = models.ManyToManyField(Item, related_name="as_infusions")
+    # Used instead of the above with settings.GW2_PACKED_UPGRADES, in API order,
+    # and indexed by `SlotUpgrade`.
+    upgrade_ids = PackedIdsField()
+    infusion_ids = PackedIdsField()
+
+    objects = ItemSlotQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["character", "bag", "index"], name="itemslot_position_unique"
+            ),
+            # Account storage has no character nor bags, which are NULL above.
+            models.UniqueConstraint(
+                fields=["storage", "index"],
+                condition=Q(character__isnull=True),
+                name="itemslot_account_position_unique",
+            ),
+        ]
 
     def get_binding(self) -> str:
         if self.binding is None:
             return ""
 
+        # bound_to is NULL for characters not synced (yet).
         to = self.bound_to
-        if to is not None:
-            return self.binding.label.format(to.name)
-        return self.binding.label
+        name = to.name if to is not None else _("another character")
+        return self.BindingChoices(self.binding).label.format(name)
+
+    @staticmethod
+    def resolve_upgrades(slots: typing.Sequence["ItemSlot"]):
+        """
+        Set `upgrade_items` and `infusion_items` of `slots`, fetched with
+        `for_display()`: from the prefetched M2M rows, or with one query for
+        the packed ids.
+        """
+        if not settings.GW2_PACKED_UPGRADES:
+            for slot in slots:
+                slot.upgrade_items = list(slot.upgrades.all())
+                slot.infusion_items = list(slot.infusions.all())
+            return
+
+        items = Item.objects.in_bulk(
+            {i for slot in slots for i in (*slot.upgrade_ids, *slot.infusion_ids)}
+        )
+        for slot in slots:
+            slot.upgrade_items = [items[i] for i in slot.upgrade_ids if i in items]
+            slot.infusion_items = [items[i] for i in slot.infusion_ids if i in items]
 
     def __str__(self):
         return f"{self.count}x {self.item}"
 
 
+class SlotUpgrade(models.Model):
+    """
+    An upgrade or infusion held by a slot, with settings.GW2_PACKED_UPGRADES:
+    the reverse index of `ItemSlot.upgrade_ids` and `infusion_ids`, written
+    along with them by the slot sync.
+    """
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name="+")
+    slot = models.ForeignKey(
+        ItemSlot, on_delete=models.CASCADE, related_name="upgrade_refs"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["item", "slot"], name="slotupgrade_item_slot_unique"
+            ),
+        ]
+
+
+class ItemLocationTotal(models.Model):
+    """
+    Amount of an item held in one location: a character's inventory, the bank
+    or the material storage. Maintained by the slot sync, see `item_totals`.
+    """
+
+    item = models.ForeignKey(
+        Item, on_delete=models.CASCADE, related_name="location_totals"
+    )
+    # "character:<id>", or the storage name for account storage.
+    location = models.CharField(max_length=32)
+    total = models.PositiveBigIntegerField()
+    stacks = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["item", "location"], name="itemlocationtotal_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.total}x {self.item_id} in {self.location}"
+
+
+class ItemTotal(models.Model):
+    """Amount of an item held in the whole account. See `item_totals`."""
+
+    item = models.OneToOneField(
+        Item, primary_key=True, on_delete=models.CASCADE, related_name="total"
+    )
+    total = models.PositiveBigIntegerField()
+    stacks = models.PositiveIntegerField()
+    locations = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.total}x {self.item_id} in {self.stacks} stacks"
+
+
+class PendingDataQuerySet(models.QuerySet):
+    def open(self):
+        """Rows not completed and not failed too many times."""
+        return self.filter(
+            completed__isnull=True,
+            failed_count__lt=PendingData.FAILED_REPEAT_COUNT,
+        )
+
+    def claim(
+        self,
+        owner: str,
+        limit: int,
+        targets: typing.Optional[typing.Iterable[str]] = None,
+        lease: datetime.timedelta = datetime.timedelta(minutes=5),
+    ) -> typing.List["PendingData"]:
+        """
+        Lease up to `limit` open rows, oldest first, to `owner`.
+
+        Rows are claimable if they are not leased or their lease has expired,
+        e.g. because the worker holding them crashed. The lease condition is
+        checked again in the UPDATE, so concurrent claimers never get the
+        same row.
+        """
+        timestamp = now()
+        free = Q(leased_until__isnull=True) | Q(leased_until__lt=timestamp)
+        with atomic():
+            candidates = self.open().filter(free)
+            if targets is not None:
+                candidates = candidates.filter(target__in=list(targets))
+            ids = list(candidates.order_by("id").values_list("id", flat=True)[:limit])
+            if not ids:
+                return []
+            self.filter(free, id__in=ids).update(
+                leased_until=timestamp + lease, lease_owner=owner
+            )
+        return list(self.filter(id__in=ids, lease_owner=owner).order_by("id"))
+
+    def compact(self, older_than: datetime.timedelta) -> int:
+        """Delete completed rows, and rows that failed too many times, older than given."""
+        before = now() - older_than
+        deleted, _ = self.filter(
+            Q(completed__lt=before)
+            | Q(failed_count__gte=PendingData.FAILED_REPEAT_COUNT, failed__lt=before)
+        ).delete()
+        return deleted
+
+
 class PendingData(models.Model):
     class TargetChoices(models.TextChoices):
         CHARACTER = "Character"
         ITEM = "Item"
         SLOT = "Slot"
+        # Account storage; the api_id is an ItemSlot.StorageChoices value.
+        STORAGE = "Storage"
 
     FAILED_REPEAT_COUNT = 3
 
@@ -209,6 +501,73 @@ class PendingData(models.Model):
     completed = models.DateTimeField(null=True)
     failed = models.DateTimeField(null=True)
     failed_count = models.PositiveIntegerField(default=0)
+    leased_until = models.DateTimeField(null=True)
+    lease_owner = models.CharField(max_length=64, blank=True, default="")
+
+    objects = PendingDataQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Open rows by target in claim order.
+            models.Index(
+                fields=["target", "id"],
+                condition=Q(completed__isnull=True),
+                name="pendingdata_open_idx",
+            ),
+            # Compaction of completed rows.
+            models.Index(
+                fields=["completed"],
+                condition=Q(completed__isnull=False),
+                name="pendingdata_completed_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Pending {self.target} info, id {self.api_id}"
+
+
+class SyncJob(models.Model):
+    """A background sync of the account; see `jobs`."""
+
+    class StatusChoices(models.TextChoices):
+        QUEUED = "Queued", _("Queued")
+        RUNNING = "Running", _("Running")
+        DONE = "Done", _("Done")
+        FAILED = "Failed", _("Failed")
+
+    ACTIVE = [StatusChoices.QUEUED, StatusChoices.RUNNING]
+
+    account = models.CharField(max_length=64, verbose_name=_("API key hash"))
+    status = models.CharField(
+        max_length=16, choices=StatusChoices.choices, default=StatusChoices.QUEUED
+    )
+    target = models.PositiveIntegerField(default=0)
+    current = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # Last progress write; a running job not updated for long has died.
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account"],
+                condition=Q(status__in=["Queued", "Running"]),
+                name="syncjob_one_active_per_account",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Sync {self.id} {self.status}, {self.current} / {self.target}"
+
+
+class DataVersion(models.Model):
+    """Single row counting writes of the account data; see `data_version`."""
+
+    version = models.PositiveBigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Data version {self.version}"
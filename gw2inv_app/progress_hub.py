@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+In-process fan-out of sync job progress to asynchronous listeners.
+
+Jobs publish from their own threads; listeners wait in an event loop. A
+listener only keeps the latest snapshot and is woken at most once until it
+reads it, so fast progress costs one loop callback per read, not per update.
+"""
+
+import asyncio
+import contextlib
+import threading
+import typing
+
+Snapshot = typing.Dict[str, typing.Any]
+
+
+class Listener:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.snapshot: typing.Optional[Snapshot] = None
+        self._loop = loop
+        self._event = asyncio.Event()
+        self._scheduled = False
+
+    def notify(self, snapshot: Snapshot):
+        """Called from any thread."""
+        self.snapshot = snapshot
+        if not self._scheduled:
+            self._scheduled = True
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    async def wait(self) -> Snapshot:
+        """Wait for a snapshot newer than the one last returned."""
+        await self._event.wait()
+        self._event.clear()
+        self._scheduled = False
+        # Read after clearing the flag, so a concurrent update is either
+        # returned now or scheduled again.
+        return self.snapshot
+
+
+class ProgressHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest: typing.Dict[int, Snapshot] = {}
+        self._listeners: typing.Dict[int, typing.Set[Listener]] = {}
+
+    def publish(self, job_id: int, snapshot: Snapshot, finished: bool = False):
+        """Send the job's progress to its listeners. Called from any thread."""
+        with self._lock:
+            if finished:
+                self._latest.pop(job_id, None)
+            else:
+                self._latest[job_id] = snapshot
+            listeners = list(self._listeners.get(job_id, ()))
+        for listener in listeners:
+            listener.notify(snapshot)
+
+    def latest(self, job_id: int) -> typing.Optional[Snapshot]:
+        """Last progress of a job running in this process, if any."""
+        with self._lock:
+            return self._latest.get(job_id)
+
+    @contextlib.contextmanager
+    def listen(self, job_id: int) -> typing.Iterator[Listener]:
+        """Register a listener for the job in the running event loop."""
+        listener = Listener(asyncio.get_running_loop())
+        with self._lock:
+            self._listeners.setdefault(job_id, set()).add(listener)
+        try:
+            yield listener
+        finally:
+            with self._lock:
+                listeners = self._listeners[job_id]
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[job_id]
+
+
+hub = ProgressHub()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import email.utils
+import threading
+import time
+import typing
+
+from django.conf import settings
+
+# Responses that mean "slow down" rather than a real error.
+RETRY_STATUSES = (429, 503)
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Up to `burst` requests may be done back to back, after which the bucket
+    refills at `rate` tokens per second. When the API tells us to slow down,
+    `backoff` halves the refill rate (down to `min_rate`) and blocks the bucket
+    for the given delay; each successful request then restores a tenth of the
+    configured rate until it is back to normal.
+
+    `clock` and `sleep` can be replaced to drive the limiter from a fake clock.
+    The limiter is thread safe.
+    """
+
+    def __init__(
+        self,
+        burst: int,
+        rate: float,
+        min_rate: typing.Optional[float] = None,
+        clock: typing.Callable[[], float] = time.monotonic,
+        sleep: typing.Callable[[float], None] = time.sleep,
+    ):
+        self.burst = burst
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Take one token. Returns the number of seconds to wait before using it."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= 1
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(delay, self._blocked_until - now)
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until it may be used. Returns the time slept."""
+        delay = self.reserve()
+        if delay > 0:
+            self._sleep(delay)
+        return delay
+
+    def backoff(self, retry_after: typing.Optional[float] = None):
+        """Slow down after the API refused a request."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            delay = retry_after if retry_after is not None else 1 / self.rate
+            self._blocked_until = max(self._blocked_until, now + delay)
+
+    def on_success(self):
+        """Recover from a previous `backoff` a step at a time."""
+        if self.rate >= self.base_rate:
+            return
+        with self._lock:
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+
+def parse_retry_after(
+    value: typing.Optional[str], now: typing.Optional[float] = None
+) -> typing.Optional[float]:
+    """Parse Retry-After header value, either delay seconds or HTTP date, into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = time.time() if now is None else now
+    return max(0.0, date.timestamp() - now)
+
+
+_default_limiter: typing.Optional[TokenBucket] = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter() -> TokenBucket:
+    """The limiter shared by all clients in this process."""
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            _default_limiter = TokenBucket(
+                burst=settings.GW2_API_BURST, rate=settings.GW2_API_RATE
+            )
+        return _default_limiter
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import io
+import json
+import os
+import random
+import time
+import typing
+import urllib.parse
+
+import requests
+import requests.adapters
+from django.conf import settings
+from requests.structures import CaseInsensitiveDict
+
+# Longest readable part of a fixture name; with the hash it stays under the
+# 255 bytes file systems allow.
+FIXTURE_NAME_MAX = 180
+
+
+def fixture_name(path: str) -> str:
+    """
+    File name of a recorded response, as also written by the `request` command.
+
+    The name is the path with slashes replaced. A query string, or whatever
+    goes past `FIXTURE_NAME_MAX`, is replaced by a sha256 of the whole path,
+    as e.g. `v2/items?ids=` lists can run to thousands of characters.
+    """
+    name, query, _ = path.partition("?")
+    name = name.replace("/", "_")
+    if query or len(name) > FIXTURE_NAME_MAX:
+        digest = hashlib.sha256(path.encode()).hexdigest()
+        name = f"{name[:FIXTURE_NAME_MAX]}-{digest}"
+    return name + ".json"
+
+
+def _api_path(url: str) -> str:
+    parts = urllib.parse.urlsplit(url)
+    path = urllib.parse.unquote(parts.path).lstrip("/")
+    if parts.query:
+        path += "?" + urllib.parse.unquote(parts.query)
+    return path
+
+
+def _make_response(
+    request: requests.PreparedRequest, status: int, body: bytes
+) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.reason = "OK" if status < 400 else "Replay error"
+    response.headers = CaseInsensitiveDict(
+        {"Content-Type": "application/json", "Content-Length": str(len(body))}
+    )
+    response.raw = io.BytesIO(body)
+    response._content = body
+    response._content_consumed = True
+    response.encoding = "utf-8"
+    response.url = request.url
+    response.request = request
+    return response
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """
+    Transport adapter serving responses from recorded JSON files instead of the API.
+
+    Each request is delayed by `latency` seconds, and `error_rate` of them
+    (0..1) fail with 503. Requests without a recording get 404, and those
+    whose recording cannot be read get 500.
+    """
+
+    def __init__(
+        self,
+        directory: typing.Union[str, os.PathLike],
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: typing.Optional[int] = None,
+    ):
+        super().__init__()
+        self.directory = str(directory)
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def send(
+        self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
+    ):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            return _make_response(request, 503, b'{"text": "replay error"}')
+
+        path = os.path.join(self.directory, fixture_name(_api_path(request.url)))
+        try:
+            with open(path, "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return _make_response(request, 404, b'{"text": "no such id"}')
+        except OSError as e:
+            body = json.dumps({"text": f"replay error: {e}"}).encode()
+            return _make_response(request, 500, body)
+        return _make_response(request, 200, body)
+
+    def close(self):
+        pass
+
+
+class RecordingAdapter(requests.adapters.HTTPAdapter):
+    """HTTP adapter that also saves every successful response for `ReplayAdapter`."""
+
+    def __init__(self, directory: typing.Union[str, os.PathLike], **kwargs):
+        super().__init__(**kwargs)
+        self.directory = str(directory)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code in (200, 206):
+            path = os.path.join(self.directory, fixture_name(_api_path(request.url)))
+            with open(path, "wt") as o:
+                json.dump(response.json(), o, indent=4)
+        return response
+
+
+def get_default_adapter(
+    pool_size: int,
+) -> typing.Optional[requests.adapters.BaseAdapter]:
+    """Replay or recording adapter if configured in settings, otherwise None."""
+    if settings.GW2_REPLAY_DIR:
+        return ReplayAdapter(
+            settings.GW2_REPLAY_DIR,
+            latency=settings.GW2_REPLAY_LATENCY,
+            error_rate=settings.GW2_REPLAY_ERROR_RATE,
+        )
+    if settings.GW2_RECORD_DIR:
+        return RecordingAdapter(
+            settings.GW2_RECORD_DIR,
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+        )
+    return None
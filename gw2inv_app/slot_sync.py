@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental synchronisation of stored item slots with fetched ones.
+
+Slots are compared by position, (bag, index), and only the differences are
+written: new positions are inserted, changed ones updated in place and
+emptied ones deleted. Upgrades and infusions are part of the compared state,
+so their M2M rows are only rewritten for slots where they changed.
+
+With settings.GW2_PACKED_UPGRADES, upgrades and infusions are kept in API
+order, duplicates included, in the slot's own `upgrade_ids` and
+`infusion_ids` columns instead.
+"""
+
+import typing
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from .dto.fast import Record
+from .models import ItemSlot
+
+# (bag, index); bag is None for storage without bags.
+Position = typing.Tuple[typing.Optional[int], int]
+
+
+class SlotState(typing.NamedTuple):
+    item_id: int
+    count: int
+    charges: typing.Optional[int] = None
+    binding: typing.Optional[str] = None
+    bound_to_id: typing.Optional[int] = None
+    upgrades: typing.Tuple[int, ...] = ()
+    infusions: typing.Tuple[int, ...] = ()
+
+    def item_ids(self) -> typing.Iterator[int]:
+        yield self.item_id
+        yield from self.upgrades
+        yield from self.infusions
+
+
+class SlotChanges(typing.NamedTuple):
+    inserts: typing.Dict[Position, SlotState]
+    # Slot id -> (stored state, fetched state)
+    updates: typing.Dict[int, typing.Tuple[SlotState, SlotState]]
+    # Slot id -> stored state
+    deletes: typing.Dict[int, SlotState]
+
+    @property
+    def size(self) -> int:
+        return len(self.inserts) + len(self.updates) + len(self.deletes)
+
+
+def _upgrade_ids(ids: typing.Optional[typing.Iterable[int]]) -> typing.Tuple[int, ...]:
+    if not ids:
+        return ()
+    if settings.GW2_PACKED_UPGRADES:
+        return tuple(ids)
+    # The M2M relations can't hold duplicates, so neither does the state.
+    return tuple(sorted(set(ids)))
+
+
+SLOT_FIELDS = ["item_id", "count", "charges", "binding", "bound_to_id"]
+
+
+def load_slot_states(
+    slots: QuerySet,
+) -> typing.Dict[Position, typing.Tuple[int, SlotState]]:
+    """Stored slot ids and states by position, in one query, or three with M2M."""
+    if settings.GW2_PACKED_UPGRADES:
+        return {
+            (bag, index): (slot_id, SlotState(*fields, tuple(ups), tuple(infs)))
+            for slot_id, bag, index, *fields, ups, infs in slots.values_list(
+                "id", "bag", "index", *SLOT_FIELDS, "upgrade_ids", "infusion_ids"
+            )
+        }
+
+    upgrades = _load_related(ItemSlot.upgrades.through, slots)
+    infusions = _load_related(ItemSlot.infusions.through, slots)
+    result = {}
+    for slot_id, bag, index, *fields in slots.values_list(
+        "id", "bag", "index", *SLOT_FIELDS
+    ):
+        result[bag, index] = slot_id, SlotState(
+            *fields,
+            upgrades=_upgrade_ids(upgrades.get(slot_id)),
+            infusions=_upgrade_ids(infusions.get(slot_id)),
+        )
+    return result
+
+
+def _load_related(through, slots: QuerySet) -> typing.Dict[int, typing.List[int]]:
+    result = {}
+    for slot_id, item_id in through.objects.filter(
+        itemslot__in=slots.values("id")
+    ).values_list("itemslot_id", "item_id"):
+        result.setdefault(slot_id, []).append(item_id)
+    return result
+
+
+def slot_state(slot: Record, characters: typing.Dict[str, int]) -> SlotState:
+    """State of a decoded inventory or bank slot; `characters` maps names to ids."""
+    return SlotState(
+        item_id=slot.id,
+        count=slot.count if slot.count is not None else 1,
+        charges=slot.charges,
+        binding=slot.binding,
+        bound_to_id=characters.get(slot.bound_to) if slot.bound_to else None,
+        upgrades=_upgrade_ids(slot.upgrades),
+        infusions=_upgrade_ids(slot.infusions),
+    )
+
+
+def inventory_states(
+    inventory: Record, characters: typing.Dict[str, int]
+) -> typing.Dict[Position, SlotState]:
+    """Slot states by position of a decoded `InventoryResponseSchema`."""
+    return {
+        (bag.index, slot.index): slot_state(slot, characters)
+        for bag in inventory.bags or ()
+        for slot in bag.inventory or ()
+    }
+
+
+class FetchedStorage(typing.NamedTuple):
+    """Storage slot states before the characters they are bound to are resolved."""
+
+    states: typing.Dict[Position, SlotState]
+    # Character names by position of the slots bound to a character.
+    bound_to: typing.Dict[Position, str]
+
+    def resolve(
+        self, characters: typing.Dict[str, int]
+    ) -> typing.Dict[Position, SlotState]:
+        states = dict(self.states)
+        for position, name in self.bound_to.items():
+            states[position] = states[position]._replace(
+                bound_to_id=characters.get(name)
+            )
+        return states
+
+
+def fetch_storage_states(slots: typing.Iterable[Record]) -> FetchedStorage:
+    """
+    Slot states of decoded bank or material storage slots, consumed one at a
+    time, e.g. from `Client.iter_bank`. Needs no database access.
+    """
+    states = {}
+    bound_to = {}
+    for slot in slots:
+        # Material storage lists empty slots with a count of 0.
+        if slot.count == 0:
+            continue
+        position = (None, slot.index)
+        states[position] = slot_state(slot, {})
+        if slot.bound_to:
+            bound_to[position] = slot.bound_to
+    return FetchedStorage(states, bound_to)
+
+
+def storage_states(
+    slots: typing.Iterable[Record], characters: typing.Dict[str, int]
+) -> typing.Dict[Position, SlotState]:
+    """Slot states by position of decoded bank or material storage slots."""
+    return fetch_storage_states(slots).resolve(characters)
+
+
+def known_items_only(
+    states: typing.Dict[Position, SlotState], known: typing.AbstractSet[int]
+) -> typing.Dict[Position, SlotState]:
+    """
+    Drop slots holding items not in `known`, and unknown upgrades and infusions
+    of the others, so they don't violate foreign keys.
+    """
+    result = {}
+    for position, state in states.items():
+        if state.item_id in known:
+            result[position] = state._replace(
+                upgrades=tuple(i for i in state.upgrades if i in known),
+                infusions=tuple(i for i in state.infusions if i in known),
+            )
+    return result
+
+
+def diff_slots(
+    stored: typing.Dict[Position, typing.Tuple[int, SlotState]],
+    fetched: typing.Dict[Position, SlotState],
+) -> SlotChanges:
+    changes = SlotChanges({}, {}, {})
+    for position, state in fetched.items():
+        if position not in stored:
+            changes.inserts[position] = state
+            continue
+        slot_id, old = stored[position]
+        if old != state:
+            changes.updates[slot_id] = old, state
+    changes.deletes.update(
+        (slot_id, old)
+        for position, (slot_id, old) in stored.items()
+        if position not in fetched
+    )
+    return changes
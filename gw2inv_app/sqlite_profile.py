@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in SQLite tuning for concurrent syncs and page loads (settings.GW2_SQLITE_PROFILE).
+
+WAL journaling lets readers run while a sync writes, and with it
+synchronous=NORMAL only syncs at checkpoints instead of on every commit;
+a crash may lose the last commits, but never corrupts the database.
+"""
+
+import typing
+
+from django.conf import settings
+
+PRAGMAS: typing.Dict[str, typing.Union[str, int]] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    # Negative: KiB, i.e. 64 MiB of page cache per connection.
+    "cache_size": -64 * 1024,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+def pragmas() -> typing.Dict[str, typing.Union[str, int]]:
+    return {**PRAGMAS, "busy_timeout": settings.GW2_SQLITE_BUSY_TIMEOUT}
+
+
+def apply_profile(sender, connection, **kwargs):
+    """`connection_created` receiver."""
+    if connection.vendor != "sqlite" or not settings.GW2_SQLITE_PROFILE:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas().items():
+            cursor.execute(f"PRAGMA {name} = {value}")
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Server-sent events of sync job progress, served directly over ASGI.
+
+Django 4.1 can't stream responses from async views, so `ProgressEvents`
+wraps the Django ASGI application and serves `/jobs/<id>/events` itself.
+Each connection is a coroutine waiting on the progress hub; no thread is
+held per viewer.
+"""
+
+import asyncio
+import json
+import re
+import typing
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .jobs import FINISHED, snapshot
+from .models import SyncJob
+from .progress_hub import Snapshot, hub
+
+JOB_EVENTS_PATH = re.compile(r"^/jobs/(\d+)/events$")
+
+# Seconds between comments keeping idle connections open.
+KEEPALIVE = 15.0
+
+
+class ProgressEvents:
+    """ASGI middleware serving job progress events, and everything else by `app`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "GET":
+            match = JOB_EVENTS_PATH.match(scope["path"])
+            if match:
+                await job_events(int(match.group(1)), receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+@sync_to_async
+def _load(job_id: int) -> typing.Optional[Snapshot]:
+    job = (
+        SyncJob.objects.filter(id=job_id)
+        .values("id", "status", "target", "current", "errors")
+        .first()
+    )
+    return snapshot(**job) if job is not None else None
+
+
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def job_events(job_id: int, receive, send):
+    """
+    Send the job's progress as `progress` events until it finishes.
+
+    Events are sent at most settings.GW2_JOB_EVENTS_RATE times a second, the
+    latest progress replacing any not sent yet. Progress of jobs running in
+    another process is polled from the database instead.
+    """
+    current = hub.latest(job_id) or await _load(job_id)
+    if current is None:
+        await send({"type": "http.response.start", "status": 404, "headers": []})
+        await send({"type": "http.response.body", "body": b"Not Found"})
+        return
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    min_interval = 1 / settings.GW2_JOB_EVENTS_RATE
+    disconnected = asyncio.ensure_future(_disconnected(receive))
+    try:
+        with hub.listen(job_id) as listener:
+            sent = None
+            while not disconnected.done():
+                if current != sent:
+                    await _send(send, b"event: progress\ndata: %s\n\n" % _json(current))
+                    sent = current
+                    if current["status"] in FINISHED:
+                        break
+                    await asyncio.sleep(min_interval)
+
+                live = hub.latest(job_id) is not None
+                update = asyncio.ensure_future(listener.wait())
+                done, _ = await asyncio.wait(
+                    {update, disconnected},
+                    timeout=KEEPALIVE if live else settings.GW2_JOB_PROGRESS_INTERVAL,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if update in done:
+                    current = update.result()
+                    continue
+                update.cancel()
+                if not live:
+                    current = await _load(job_id) or current
+                if current == sent:
+                    await _send(send, b": keepalive\n\n")
+    finally:
+        disconnected.cancel()
+    await _send(send, b"", more_body=False)
+
+
+def _json(data: Snapshot) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+async def _send(send, body: bytes, more_body: bool = True):
+    await send({"type": "http.response.body", "body": body, "more_body": more_body})
@@ -0,0 +1,568 @@
+# -*- coding: utf-8 -*-
+import datetime
+import email.utils
+import http.server
+import json
+import os
+import tempfile
+import threading
+import time
+import typing
+from unittest import mock
+from urllib.parse import unquote
+
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.timezone import now
+
+from .fetcher import Progress, update_characters_concurrent
+from .gw_client import Client, ItemStatus
+from .jobs import JobProgress
+from .models import Character, Item, ItemSlot, PendingData, SlotUpgrade, SyncJob
+from .rate_limit import TokenBucket, parse_retry_after
+from .replay import ReplayAdapter, fixture_name
+from .slot_sync import SlotState, diff_slots, load_slot_states
+from .writer import BatchWriter
+
+
+class FakeClock:
+    """Clock and sleep for `TokenBucket`; sleeping advances the clock."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTests(SimpleTestCase):
+    def make_bucket(self, burst=3, rate=2.0, **kwargs):
+        self.clock = FakeClock()
+        return TokenBucket(
+            burst, rate, clock=self.clock, sleep=self.clock.sleep, **kwargs
+        )
+
+    def test_burst(self):
+        bucket = self.make_bucket(burst=3, rate=2.0)
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(self.clock.slept, [])
+
+        # One token short: wait for half a second at 2 tokens per second.
+        self.assertEqual(bucket.acquire(), 0.5)
+        self.assertEqual(self.clock.slept, [0.5])
+
+    def test_reservations_queue_up(self):
+        bucket = self.make_bucket(burst=1, rate=2.0)
+        self.assertEqual([bucket.reserve() for _ in range(4)], [0.0, 0.5, 1.0, 1.5])
+
+    def test_refill(self):
+        bucket = self.make_bucket(burst=3, rate=2.0)
+        for _ in range(3):
+            bucket.acquire()
+
+        self.clock.now += 1.0
+        self.assertEqual([bucket.reserve() for _ in range(2)], [0.0, 0.0])
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_refill_up_to_burst(self):
+        bucket = self.make_bucket(burst=3, rate=2.0)
+        self.clock.now += 3600.0
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_backoff_halves_rate_and_blocks(self):
+        bucket = self.make_bucket(burst=3, rate=2.0)
+        bucket.backoff()
+        self.assertEqual(bucket.rate, 1.0)
+        # Blocked for one token at the new rate, although tokens are left.
+        self.assertEqual(bucket.acquire(), 1.0)
+        # The tokens left were dropped.
+        self.assertEqual(bucket.reserve(), 1.0)
+
+    def test_backoff_retry_after(self):
+        bucket = self.make_bucket(burst=3, rate=2.0)
+        bucket.backoff(retry_after=30.0)
+        self.assertEqual(bucket.reserve(), 30.0)
+
+        self.clock.now += 10.0
+        self.assertEqual(bucket.reserve(), 20.0)
+
+        # A shorter delay does not shorten the block.
+        bucket.backoff(retry_after=1.0)
+        self.assertEqual(bucket.reserve(), 20.0)
+
+    def test_backoff_min_rate(self):
+        bucket = self.make_bucket(burst=3, rate=2.0, min_rate=0.5)
+        for _ in range(5):
+            bucket.backoff()
+        self.assertEqual(bucket.rate, 0.5)
+
+        bucket = self.make_bucket(burst=3, rate=16.0)
+        for _ in range(10):
+            bucket.backoff()
+        self.assertEqual(bucket.rate, 1.0)
+
+    def test_on_success_recovers_stepwise(self):
+        bucket = self.make_bucket(burst=3, rate=10.0)
+        bucket.backoff()
+        bucket.backoff()
+        self.assertEqual(bucket.rate, 2.5)
+
+        rates = []
+        for _ in range(10):
+            bucket.on_success()
+            rates.append(bucket.rate)
+        self.assertEqual(rates[:3], [3.5, 4.5, 5.5])
+        self.assertEqual(rates[-4:], [9.5, 10.0, 10.0, 10.0])
+
+    def test_on_success_at_full_rate(self):
+        bucket = self.make_bucket(burst=3, rate=2.0)
+        bucket.on_success()
+        self.assertEqual(bucket.rate, 2.0)
+
+
+class ParseRetryAfterTests(SimpleTestCase):
+    now = 1_700_000_000.0
+
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("120"), 120.0)
+        self.assertEqual(parse_retry_after(" 5 "), 5.0)
+        self.assertEqual(parse_retry_after("0"), 0.0)
+
+    def test_http_date(self):
+        value = email.utils.formatdate(self.now + 30, usegmt=True)
+        self.assertEqual(parse_retry_after(value, now=self.now), 30.0)
+
+    def test_http_date_in_the_past(self):
+        value = email.utils.formatdate(self.now - 30, usegmt=True)
+        self.assertEqual(parse_retry_after(value, now=self.now), 0.0)
+
+    def test_missing_or_invalid(self):
+        for value in (None, "", "soon", "-1", "1.5"):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_retry_after(value, now=self.now))
+
+
+@override_settings(GW2_PACKED_UPGRADES=False)
+class SlotViewTests(TestCase):
+    # Queries for a page of slots: the slots, and in M2M mode their
+    # prefetched upgrades and infusions.
+    page_queries = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        Item.objects.bulk_create(
+            Item(
+                id=i,
+                name=f"Item {i}",
+                chat_link="[&AgEAAAA=]",
+                description="",
+                type=Item.Type.TROPHY,
+                rarity=Item.Rarity.BASIC,
+                level=0,
+            )
+            for i in range(1, 4)
+        )
+        cls.character = Character.objects.create(
+            name="Some Character", race="Norn", profession="Thief", level=80
+        )
+        ItemSlot.objects.bulk_create(
+            ItemSlot(character=cls.character, bag=bag, index=index, item_id=1)
+            for bag in range(2)
+            for index in range(3)
+        )
+        ItemSlot.objects.bulk_create(
+            ItemSlot(
+                character=None,
+                storage=ItemSlot.StorageChoices.BANK,
+                index=index,
+                item_id=2,
+            )
+            for index in range(5)
+        )
+
+    def setUp(self):
+        # The data version, the character and the rendered pages are cached.
+        cache.clear()
+        patcher = mock.patch("gw2inv_app.views.PAGE_SIZE", 4)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def positions(self, response):
+        return [(slot.bag, slot.index) for slot in response.context["page"].slots]
+
+    def test_character_pages(self):
+        url = f"/characters/{self.character.name}"
+        # The data version, the character and the page.
+        with self.assertNumQueries(2 + self.page_queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.positions(response), [(0, 0), (0, 1), (0, 2), (1, 0)])
+        self.assertEqual(response.context["page"].next, "after=1,0")
+
+        with self.assertNumQueries(self.page_queries):
+            response = self.client.get(url + "?" + response.context["page"].next)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.positions(response), [(1, 1), (1, 2)])
+        self.assertIsNone(response.context["page"].next)
+
+    def test_storage_pages(self):
+        # The data version and the page.
+        with self.assertNumQueries(1 + self.page_queries):
+            response = self.client.get("/storage/Bank")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.positions(response), [(None, 0), (None, 1), (None, 2), (None, 3)]
+        )
+        self.assertEqual(response.context["page"].next, "after=3")
+
+        with self.assertNumQueries(self.page_queries):
+            response = self.client.get("/storage/Bank?after=3")
+        self.assertEqual(self.positions(response), [(None, 4)])
+        self.assertIsNone(response.context["page"].next)
+
+    def test_cached_page(self):
+        self.client.get("/storage/Bank")
+        with self.assertNumQueries(0):
+            response = self.client.get("/storage/Bank")
+        self.assertEqual(response.status_code, 200)
+
+    def test_malformed_after(self):
+        for url in (
+            "/storage/Bank?after=x",
+            "/storage/Bank?after=1,2",
+            f"/characters/{self.character.name}?after=1",
+            f"/characters/{self.character.name}?after=1,",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_unknown_character_or_storage(self):
+        for url in (
+            "/characters/Nobody",
+            "/storage/Nothing",
+            "/storage/Inventory",
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(GW2_PACKED_UPGRADES=True)
+class PackedSlotViewTests(SlotViewTests):
+    # Upgrades are in the slot rows, and there are none to look up.
+    page_queries = 1
+
+
+class StubApi:
+    """
+    GW2 API serving `characters` on a local port, from a thread. Characters
+    mapped to None are listed, but their core data is not found.
+
+    Each request takes `delay` seconds, and the most requests handled at the
+    same time are counted in `max_in_flight`.
+    """
+
+    def __init__(self, characters: typing.Dict[str, typing.Dict], delay=0.05):
+        self.characters = characters
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), self._make_handler()
+        )
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        host, port = self._server.server_address
+        self.base_url = f"http://{host}:{port}/"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def respond(self, path: str) -> typing.Optional[typing.Any]:
+        if path == "/v2/characters":
+            return list(self.characters)
+        prefix, suffix = "/v2/characters/", "/core"
+        if path.startswith(prefix) and path.endswith(suffix):
+            return self.characters.get(unquote(path[len(prefix) : -len(suffix)]))
+        return None
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with api._lock:
+                    api.in_flight += 1
+                    api.max_in_flight = max(api.max_in_flight, api.in_flight)
+                try:
+                    time.sleep(api.delay)
+                    data = api.respond(self.path)
+                finally:
+                    with api._lock:
+                        api.in_flight -= 1
+
+                body = json.dumps(data).encode() if data is not None else b"{}"
+                self.send_response(200 if data is not None else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class UpdateCharactersConcurrentTests(TestCase):
+    def make_client(self, api: StubApi) -> Client:
+        return Client(
+            base_url=api.base_url,
+            cache=False,
+            limiter=TokenBucket(1000, 1000.0),
+            max_retries=0,
+        )
+
+    def test_stores_characters(self):
+        characters = {
+            f"Character {i}": {
+                "name": f"Character {i}",
+                "race": "Asura",
+                "profession": "Engineer",
+                "level": i + 1,
+                "gender": "Female",
+            }
+            for i in range(12)
+        }
+        Character.objects.create(
+            name="Deleted", race="Human", profession="Guardian", level=80
+        )
+
+        progress = Progress(lambda: None)
+        with StubApi(characters) as api, self.make_client(api) as client:
+            update_characters_concurrent(progress, concurrency=3, client=client)
+
+        self.assertEqual(progress.errors, [])
+        stored = {
+            c.name: (c.race, c.profession, c.level)
+            for c in Character.objects.filter(deleted=False)
+        }
+        self.assertEqual(
+            stored,
+            {
+                name: (data["race"], data["profession"], data["level"])
+                for name, data in characters.items()
+            },
+        )
+        self.assertTrue(Character.objects.get(name="Deleted").deleted)
+        self.assertFalse(PendingData.objects.filter(completed__isnull=True).exists())
+
+        # The character list is fetched alone; the cores concurrently, but
+        # never more than `concurrency` at a time.
+        self.assertGreater(api.max_in_flight, 1)
+        self.assertLessEqual(api.max_in_flight, 3)
+
+    def test_failed_character(self):
+        characters = {
+            "Found": {
+                "name": "Found",
+                "race": "Charr",
+                "profession": "Warrior",
+                "level": 80,
+            },
+            "Missing": None,
+        }
+        progress = Progress(lambda: None)
+        with StubApi(characters) as api, self.make_client(api) as client:
+            with self.assertLogs("gw2inv_app.writer", "WARNING"):
+                update_characters_concurrent(progress, concurrency=2, client=client)
+
+        self.assertEqual(len(progress.errors), 1)
+        self.assertEqual(progress.current, 2)
+        self.assertEqual(
+            list(Character.objects.values_list("name", flat=True)), ["Found"]
+        )
+        failed = PendingData.objects.get(failed__isnull=False)
+        self.assertEqual(failed.api_id, "Missing")
+
+
+class ReplayTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.client = Client(
+            adapter=ReplayAdapter(self.directory),
+            limiter=TokenBucket(1000, 1000.0),
+            max_retries=0,
+        )
+        self.addCleanup(self.client.close)
+
+    def test_fixture_name(self):
+        self.assertEqual(
+            fixture_name("v2/characters/Some One/core"),
+            "v2_characters_Some One_core.json",
+        )
+
+        ids = ",".join(str(i) for i in range(10000, 10200))
+        name = fixture_name("v2/items?ids=" + ids)
+        self.assertTrue(name.startswith("v2_items-"))
+        self.assertLessEqual(len(name), 255)
+        self.assertNotEqual(name, fixture_name("v2/items?ids=" + ids + ",1"))
+
+        name = fixture_name("v2/" + "x" * 1000)
+        self.assertLessEqual(len(name), 255)
+
+    def test_replay_long_query(self):
+        ids = range(10000, 10200)
+        path = "v2/items?ids=" + ",".join(str(i) for i in ids)
+        with open(os.path.join(self.directory, fixture_name(path)), "wt") as o:
+            json.dump([], o)
+
+        items = self.client.get_items(ids)
+        self.assertEqual({item.status for item in items.values()}, {ItemStatus.MISSING})
+
+    def test_replay_missing_and_unreadable(self):
+        # Without a recording, none of the ids exist.
+        items = self.client.get_items([1, 2])
+        self.assertEqual({item.status for item in items.values()}, {ItemStatus.MISSING})
+
+        os.mkdir(os.path.join(self.directory, fixture_name("v2/characters")))
+        with self.assertRaises(requests.HTTPError) as cm:
+            self.client.get_characters()
+        self.assertEqual(cm.exception.response.status_code, 500)
+
+
+@override_settings(GW2_PACKED_UPGRADES=False)
+class UpgradeLookupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Item.objects.bulk_create(
+            Item(
+                id=i,
+                name=f"Item {i}",
+                chat_link="[&AgEAAAA=]",
+                description="",
+                type=Item.Type.UPGRADE_COMPONENT,
+                rarity=Item.Rarity.EXOTIC,
+                level=80,
+            )
+            for i in range(1, 5)
+        )
+        cls.character = Character.objects.create(
+            name="Some Character", race="Human", profession="Guardian", level=80
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def sync(self, fetched):
+        owner = {"character_id": self.character.id}
+        stored = load_slot_states(ItemSlot.objects.filter(**owner))
+        with BatchWriter(Progress(lambda: None)) as writer:
+            writer.add_slot_changes(owner, diff_slots(stored, fetched))
+
+    def slotted(self, item_id):
+        return sorted(
+            (slot.bag, slot.index) for slot in ItemSlot.objects.with_upgrade(item_id)
+        )
+
+    def test_with_upgrade(self):
+        self.sync(
+            {
+                (0, 0): SlotState(1, 1, upgrades=(2,), infusions=(3,)),
+                (0, 1): SlotState(1, 1, upgrades=(2,)),
+                (0, 2): SlotState(1, 1),
+            }
+        )
+        self.assertEqual(self.slotted(2), [(0, 0), (0, 1)])
+        self.assertEqual(self.slotted(3), [(0, 0)])
+        self.assertEqual(self.slotted(4), [])
+
+        # Changed, unchanged and emptied slots.
+        self.sync(
+            {
+                (0, 0): SlotState(1, 1, upgrades=(4,), infusions=(3,)),
+                (0, 2): SlotState(1, 1),
+            }
+        )
+        self.assertEqual(self.slotted(2), [])
+        self.assertEqual(self.slotted(3), [(0, 0)])
+        self.assertEqual(self.slotted(4), [(0, 0)])
+
+    def test_upgrade_view(self):
+        self.sync({(1, 5): SlotState(1, 1, upgrades=(2,), infusions=(2,))})
+
+        response = self.client.get("/upgrades/2")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(slot.bag, slot.index) for slot in response.context["page"].slots],
+            [(1, 5)],
+        )
+        self.assertContains(response, "Some Character, bag 1")
+        self.assertEqual(self.client.get("/upgrades/1000").status_code, 404)
+
+
+@override_settings(GW2_PACKED_UPGRADES=True)
+class PackedUpgradeLookupTests(UpgradeLookupTests):
+    def test_index_rows(self):
+        self.sync({(0, 0): SlotState(1, 1, upgrades=(2, 2), infusions=(2, 3))})
+        self.assertEqual(
+            sorted(SlotUpgrade.objects.values_list("item_id", flat=True)), [2, 3]
+        )
+
+
+class JobProgressTests(TestCase):
+    def setUp(self):
+        self.job = SyncJob.objects.create(account="test")
+        self.clock = FakeClock()
+        self.progress = JobProgress(
+            self.job.id, interval=1.0, clock=self.clock, heartbeat=60.0
+        )
+
+    def stored(self):
+        self.job.refresh_from_db()
+        return self.job.status, self.job.current, self.job.target
+
+    def test_throttled_update_written_by_beat(self):
+        self.progress.save(status=SyncJob.StatusChoices.RUNNING)
+        self.progress.add_target(3)
+        self.progress.add_current()
+        self.assertEqual(self.stored(), ("Running", 0, 0))
+
+        self.progress.beat()
+        self.assertEqual(self.stored(), ("Running", 0, 0))
+
+        self.clock.now += 1.0
+        self.progress.beat()
+        self.assertEqual(self.stored(), ("Running", 1, 3))
+
+    def test_heartbeat(self):
+        self.progress.save(status=SyncJob.StatusChoices.RUNNING)
+        long_ago = now() - datetime.timedelta(hours=1)
+        SyncJob.objects.filter(id=self.job.id).update(updated=long_ago)
+
+        self.clock.now += 30.0
+        self.progress.beat()
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.updated, long_ago)
+
+        self.clock.now += 30.0
+        self.progress.beat()
+        self.job.refresh_from_db()
+        self.assertGreater(self.job.updated, long_ago)
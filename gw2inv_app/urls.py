@@ -5,6 +5,11 @@ from . import views
 app_name = "gw2inv_app"
 
 urlpatterns = [
-    path("", views.index),
+    path("", views.index, name="index"),
+    path("characters/<str:name>", views.character_detail, name="character"),
+    path("storage/<str:storage>", views.storage_detail, name="storage"),
+    path("upgrades/<int:item_id>", views.upgrade_detail, name="upgrade"),
     path("full_update", views.full_update, name="full_update"),
+    path("jobs/<int:job_id>", views.job_status, name="job_status"),
+    path("debug/api_metrics", views.api_metrics, name="api_metrics"),
 ]
@@ -1,21 +1,221 @@
-from django.http import HttpResponse
+import typing
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import BadRequest
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q, QuerySet
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+
+from . import data_version, http_metrics
+from .jobs import JobRunning, start_sync
+from .models import Character, Item, ItemSlot, SyncJob
+
+# Slots per page of the inventory and storage views.
+PAGE_SIZE = 200
+
+
+def read_view(view):
+    """
+    Answer conditional requests with 304 Not Modified until the next sync,
+    and make browsers revalidate every time.
+    """
+    view = condition(etag_func=data_version.etag)(view)
+    return cache_control(private=True, no_cache=True)(view)
+
 
-from .fetcher import Progress, update_characters
-from .models import Character
+def _cache_context(
+    using: str = DEFAULT_DB_ALIAS, **vary_on
+) -> typing.Dict[str, typing.Any]:
+    """Template context for `{% cache cache_timeout ... cache_version %}`."""
+    return {
+        "cache_timeout": settings.GW2_FRAGMENT_CACHE_TIMEOUT,
+        "cache_version": data_version.current(using),
+        **vary_on,
+    }
 
 
+def index_context(characters: QuerySet) -> typing.Dict[str, typing.Any]:
+    """Template context of the index page; see also the bench_sqlite command."""
+    return {
+        **_cache_context(using=characters.db),
+        # Evaluated by the template, only on a fragment cache miss.
+        "characters": characters,
+        "storages": [
+            ItemSlot.StorageChoices.BANK,
+            ItemSlot.StorageChoices.MATERIALS,
+        ],
+    }
+
+
+@read_view
 def index(request):
+    return render(
+        request, "gw2inv_app/index.html", index_context(Character.objects.all())
+    )
+
+
+class SlotPage(typing.NamedTuple):
+    slots: typing.List[ItemSlot]
+    # Query string of the next page, None on the last one.
+    next: typing.Optional[str]
+
+
+def _after(fields: typing.Sequence[str], values: typing.Sequence[int]) -> Q:
+    """Rows whose `fields` compare greater than `values`, as tuples."""
+    field, *rest = fields
+    value, *rest_values = values
+    if not rest:
+        return Q(**{field + "__gt": value})
+    return Q(**{field + "__gt": value}) | Q(**{field: value}) & _after(
+        rest, rest_values
+    )
+
+
+def slot_page(request, slots: QuerySet, order: typing.Sequence[str]) -> SlotPage:
+    """
+    The page of `slots` after the `after` query parameter, by keyset
+    pagination on the unique, non-null `order` fields: each page is an index
+    range scan, however deep it is.
+    """
+    after = request.GET.get("after")
+    if after:
+        try:
+            values = [int(v) for v in after.split(",")]
+        except ValueError:
+            raise BadRequest("Invalid page")
+        if len(values) != len(order):
+            raise BadRequest("Invalid page")
+        slots = slots.filter(_after(order, values))
+
+    page = list(slots.for_display().order_by(*order)[: PAGE_SIZE + 1])
+    next_page = None
+    if len(page) > PAGE_SIZE:
+        page = page[:PAGE_SIZE]
+        last = page[-1]
+        next_page = "after=" + ",".join(str(getattr(last, f)) for f in order)
+    ItemSlot.resolve_upgrades(page)
+    return SlotPage(page, next_page)
+
+
+@read_view
+def character_detail(request, name: str):
+    version = data_version.current()
+    character = cache.get_or_set(
+        f"gw2inv:character:{version}:{quote(name)}",
+        lambda: Character.objects.filter(name=name).first(),
+        settings.GW2_FRAGMENT_CACHE_TIMEOUT,
+    )
+    if character is None:
+        raise Http404
+    slots = ItemSlot.objects.filter(character=character, bag__isnull=False)
     return render(
         request,
-        "gw2inv_app/index.html",
+        "gw2inv_app/character.html",
         {
-            "characters": Character.objects.all(),
+            **_cache_context(owner=character.id, after=request.GET.get("after")),
+            "character": character,
+            "page": SimpleLazyObject(
+                lambda: slot_page(request, slots, ["bag", "index"])
+            ),
         },
     )
 
 
+@read_view
+def storage_detail(request, storage: str):
+    if storage not in (ItemSlot.StorageChoices.BANK, ItemSlot.StorageChoices.MATERIALS):
+        raise Http404
+    slots = ItemSlot.objects.filter(character__isnull=True, storage=storage)
+    return render(
+        request,
+        "gw2inv_app/storage.html",
+        {
+            **_cache_context(owner=storage, after=request.GET.get("after")),
+            "storage": ItemSlot.StorageChoices(storage),
+            "page": SimpleLazyObject(lambda: slot_page(request, slots, ["index"])),
+        },
+    )
+
+
+@read_view
+def upgrade_detail(request, item_id: int):
+    """Where the upgrade or infusion is slotted."""
+    item = Item.objects.filter(id=item_id).first()
+    if item is None:
+        raise Http404
+    slots = ItemSlot.objects.with_upgrade(item_id).select_related("character")
+    return render(
+        request,
+        "gw2inv_app/upgrade.html",
+        {
+            **_cache_context(
+                owner=f"upgrade:{item_id}", after=request.GET.get("after")
+            ),
+            "item": item,
+            "page": SimpleLazyObject(lambda: slot_page(request, slots, ["id"])),
+        },
+    )
+
+
+def _job_response(job: SyncJob, status: int) -> JsonResponse:
+    status_url = reverse("gw2inv_app:job_status", args=[job.id])
+    return JsonResponse(
+        {
+            "id": job.id,
+            "status": job.status,
+            "status_url": status_url,
+            # Served by sse.ProgressEvents when running under ASGI.
+            "events_url": status_url + "/events",
+        },
+        status=status,
+    )
+
+
+@require_POST
 def full_update(request):
-    progress = Progress(lambda: None)
-    update_characters(progress)  # FIXME: This may be a long operation.
-    return HttpResponse(f"Done {progress.current} / {progress.target}".encode())
+    """Start a sync in the background; poll the returned status_url for progress."""
+    try:
+        job = start_sync()
+    except JobRunning as e:
+        return _job_response(e.job, 409)
+    return _job_response(job, 202)
+
+
+def job_status(request, job_id: int):
+    job = (
+        SyncJob.objects.filter(id=job_id)
+        .values(
+            "id",
+            "status",
+            "target",
+            "current",
+            "errors",
+            "created",
+            "started",
+            "finished",
+        )
+        .first()
+    )
+    if job is None:
+        raise Http404
+    return JsonResponse(job)
+
+
+def api_metrics(request):
+    """GW2 API request metrics of this process; `?format=prometheus` for scraping."""
+    if not settings.GW2_HTTP_METRICS_ENDPOINT:
+        raise Http404
+    snapshot = http_metrics.registry.snapshot()
+    if request.GET.get("format") == "prometheus":
+        return HttpResponse(
+            http_metrics.prometheus(snapshot),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
+    return JsonResponse(snapshot)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Concurrent processing of the PendingData queue."""
+
+import contextlib
+import datetime
+import itertools
+import queue
+import threading
+import typing
+import zlib
+
+from django.conf import settings
+
+from .fetcher import (
+    Progress,
+    _store_character,
+    _store_inventory,
+    _store_storage,
+    lease_owner,
+)
+from .gw_client import MAX_IDS_PER_REQUEST, Client
+from .models import ItemSlot, PendingData
+from .slot_sync import fetch_storage_states
+from .writer import BatchWriter
+
+
+class Handler:
+    """
+    Processing of one PendingData target.
+
+    `fetch` runs in a worker thread and must not use the database; `store`
+    runs in the thread that drains the queue and passes the results to the
+    batch writer. The client is passed to `store` for follow-up requests that
+    depend on the database, such as items missing from it.
+    """
+
+    def key(self, pending: PendingData) -> typing.Optional[str]:
+        """Rows with the same key are handled in order by the same worker."""
+        return pending.api_id
+
+    def fetch(self, client: Client, rows: typing.List[PendingData]):
+        raise NotImplementedError
+
+    def store(
+        self,
+        rows: typing.List[PendingData],
+        result: typing.Union[typing.Any, Exception],
+        writer: BatchWriter,
+        client: Client,
+    ):
+        raise NotImplementedError
+
+
+class CharacterHandler(Handler):
+    def fetch(self, client, rows):
+        return client.get_character_core(rows[0].api_id)
+
+    def store(self, rows, result, writer, client):
+        _store_character(rows[0], result, writer)
+
+
+class InventoryHandler(Handler):
+    def fetch(self, client, rows):
+        return client.get_character_inventory(rows[0].api_id)
+
+    def store(self, rows, result, writer, client):
+        _store_inventory(rows[0], result, writer, client)
+
+
+class StorageHandler(Handler):
+    def fetch(self, client, rows):
+        if rows[0].api_id == ItemSlot.StorageChoices.BANK:
+            slots = client.iter_bank()
+        else:
+            slots = client.iter_materials()
+        # Streamed into the slot states; bound characters are resolved in `store`.
+        return fetch_storage_states(slots)
+
+    def store(self, rows, result, writer, client):
+        _store_storage(rows[0], result, writer, client)
+
+
+HANDLERS: typing.Dict[str, Handler] = {
+    PendingData.TargetChoices.CHARACTER: CharacterHandler(),
+    PendingData.TargetChoices.SLOT: InventoryHandler(),
+    PendingData.TargetChoices.STORAGE: StorageHandler(),
+}
+
+
+class Task(typing.NamedTuple):
+    handler: Handler
+    rows: typing.List[PendingData]
+
+
+def _make_tasks(
+    rows: typing.Iterable[PendingData],
+) -> typing.Iterator[typing.Tuple[typing.Optional[str], Task]]:
+    for pending in rows:
+        handler = HANDLERS[pending.target]
+        yield handler.key(pending), Task(handler, [pending])
+
+
+def _work(client: Client, tasks: queue.Queue, results: queue.Queue):
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        try:
+            result = task.handler.fetch(client, task.rows)
+        except Exception as e:
+            result = e
+        results.put((task, result))
+
+
+def drain(
+    progress: Progress,
+    workers: typing.Optional[int] = None,
+    targets: typing.Optional[typing.Iterable[str]] = None,
+    client: typing.Optional[Client] = None,
+    batch_size: typing.Optional[int] = None,
+):
+    """
+    Process open PendingData rows with a pool of `workers` threads.
+
+    Rows are leased from the queue `batch_size` at a time, oldest first. Each
+    worker has its own task queue, and rows are assigned to workers by their
+    handler's key, so e.g. all rows of one character are processed in order
+    by one worker. Results are written in the calling thread in batches.
+    Rows that fail keep their lease, so they are not retried before it expires.
+    """
+    workers = workers or settings.GW2_SYNC_CONCURRENCY
+    batch_size = batch_size or workers * MAX_IDS_PER_REQUEST
+    targets = list(targets) if targets is not None else list(HANDLERS)
+    lease = datetime.timedelta(seconds=settings.GW2_QUEUE_LEASE_SECONDS)
+    owner = lease_owner()
+
+    if client is None:
+        client = Client(pool_size=workers)
+    else:
+        client = contextlib.nullcontext(client)
+
+    task_queues = [queue.Queue() for _ in range(workers)]
+    results = queue.Queue()
+    with client as client:
+        threads = [
+            threading.Thread(
+                target=_work,
+                args=(client, q, results),
+                name=f"gw2-worker-{i}",
+                daemon=True,
+            )
+            for i, q in enumerate(task_queues)
+        ]
+        for t in threads:
+            t.start()
+
+        try:
+            with BatchWriter(progress) as writer:
+                while True:
+                    rows = PendingData.objects.claim(owner, batch_size, targets, lease)
+                    if not rows:
+                        break
+                    n_tasks = _dispatch(rows, task_queues)
+                    while n_tasks:
+                        try:
+                            task, result = results.get(timeout=writer.time_to_flush())
+                        except queue.Empty:
+                            writer.flush()
+                            continue
+                        task.handler.store(task.rows, result, writer, client)
+                        n_tasks -= 1
+        finally:
+            for q in task_queues:
+                q.put(None)
+            for t in threads:
+                t.join()
+
+
+def _dispatch(rows: typing.List[PendingData], task_queues: typing.List[queue.Queue]):
+    round_robin = itertools.cycle(range(len(task_queues)))
+    n_tasks = 0
+    for key, task in _make_tasks(rows):
+        if key is None:
+            shard = next(round_robin)
+        else:
+            shard = zlib.crc32(key.encode()) % len(task_queues)
+        task_queues[shard].put(task)
+        n_tasks += 1
+    return n_tasks
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""Batched database writes of fetched results."""
+
+import logging
+import time
+import typing
+
+from django.conf import settings
+from django.db.models import F
+from django.db.transaction import atomic
+from django.utils.timezone import now
+
+from . import data_version, item_totals
+from .catalogue import UPDATE_FIELDS as ITEM_UPDATE_FIELDS
+from .dto.fast import Record
+from .models import Character, Item, ItemSlot, PendingData, SlotUpgrade
+from .slot_sync import SlotChanges, SlotState
+
+logger = logging.getLogger(__name__)
+
+CHARACTER_UPDATE_FIELDS = ["race", "profession", "level", "deleted"]
+SLOT_UPDATE_FIELDS = ["item", "count", "charges", "binding", "bound_to"]
+PACKED_UPDATE_FIELDS = ["upgrade_ids", "infusion_ids"]
+
+
+class BatchWriter:
+    """
+    Collects fetched characters, items and slot changes, and writes them in one
+    transaction every `flush_every` records or `flush_interval` seconds.
+
+    Characters and items are upserted with `bulk_create(update_conflicts=True)`.
+    Slot changes from `slot_sync.diff_slots` are applied after the items they
+    may refer to, rewriting only the changed rows and M2M relations (or packed
+    upgrade columns and their `SlotUpgrade` index, with
+    settings.GW2_PACKED_UPGRADES), and the per-location item totals are
+    adjusted by the same changes.
+    PendingData rows passed along with the results are marked completed (or
+    failed) in the same transaction, and counted in `progress` when written.
+    Flushes writing account data bump `data_version`.
+    Use as a context manager to flush the remainder at the end.
+    """
+
+    def __init__(
+        self,
+        progress,
+        flush_every: int = 500,
+        flush_interval: float = 0.5,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        self.progress = progress
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._clock = clock
+        self._last_flush = clock()
+        self._characters: typing.Dict[str, Character] = {}
+        self._items: typing.Dict[int, Item] = {}
+        self._slot_changes: typing.List[typing.Tuple[typing.Dict, SlotChanges]] = []
+        self._completed: typing.List[PendingData] = []
+        self._failed: typing.List[PendingData] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return (
+            len(self._characters)
+            + len(self._items)
+            + sum(changes.size for _, changes in self._slot_changes)
+            + len(self._completed)
+            + len(self._failed)
+        )
+
+    def add_character(self, data: typing.Dict, pending: PendingData = None):
+        self._characters[data["name"]] = Character(**data, deleted=False)
+        self._done(pending)
+
+    def add_item(
+        self,
+        data: typing.Union[Record, typing.Dict],
+        pending: PendingData = None,
+    ):
+        if isinstance(data, Record):
+            data = data.to_dict()
+        self._items[data["id"]] = Item(**data)
+        self._done(pending)
+
+    def add_slot_changes(
+        self,
+        owner: typing.Dict[str, typing.Any],
+        changes: SlotChanges,
+        pending: PendingData = None,
+    ):
+        """Apply `changes` to the slots of `owner`, e.g. `{"character_id": 1}`."""
+        if changes.size:
+            self._slot_changes.append((owner, changes))
+        self._done(pending)
+
+    def fail(self, pending: typing.Optional[PendingData], message: str, error=None):
+        self.progress.add_error(message)
+        if error is None:
+            logger.warning("%s", message)
+        else:
+            logger.warning("%s: %r", message, error)
+        if pending is not None:
+            self._failed.append(pending)
+        self.maybe_flush()
+
+    def _done(self, pending: typing.Optional[PendingData]):
+        if pending is not None:
+            self._completed.append(pending)
+        self.maybe_flush()
+
+    def time_to_flush(self) -> float:
+        """Seconds until the pending records are due to be written."""
+        if not len(self):
+            return self.flush_interval
+        return max(0.0, self._last_flush + self.flush_interval - self._clock())
+
+    def maybe_flush(self):
+        if len(self) >= self.flush_every or (len(self) and not self.time_to_flush()):
+            self.flush()
+
+    def flush(self):
+        self._last_flush = self._clock()
+        if not len(self):
+            return
+
+        timestamp = now()
+        changed = self._characters or self._items or self._slot_changes
+        with atomic():
+            if self._characters:
+                Character.objects.bulk_create(
+                    self._characters.values(),
+                    update_conflicts=True,
+                    unique_fields=["name"],
+                    update_fields=CHARACTER_UPDATE_FIELDS,
+                )
+            if self._items:
+                Item.objects.bulk_create(
+                    self._items.values(),
+                    update_conflicts=True,
+                    unique_fields=["id"],
+                    update_fields=ITEM_UPDATE_FIELDS,
+                )
+            deltas = item_totals.Deltas()
+            if self._slot_changes:
+                self._write_slot_changes(deltas)
+            item_totals.apply_deltas(deltas)
+            if self._completed:
+                PendingData.objects.filter(
+                    id__in=[p.id for p in self._completed]
+                ).update(completed=timestamp)
+            if self._failed:
+                PendingData.objects.filter(id__in=[p.id for p in self._failed]).update(
+                    failed=timestamp, failed_count=F("failed_count") + 1
+                )
+            if changed:
+                data_version.bump()
+
+        done = len(self._completed) + len(self._failed)
+        self._characters.clear()
+        self._items.clear()
+        self._slot_changes.clear()
+        self._completed.clear()
+        self._failed.clear()
+        if done:
+            self.progress.add_current(done)
+
+    def _write_slot_changes(self, deltas: item_totals.Deltas):
+        packed = settings.GW2_PACKED_UPGRADES
+        deletes: typing.List[int] = []
+        updates: typing.List[typing.Tuple[ItemSlot, SlotState, SlotState]] = []
+        inserts: typing.List[typing.Tuple[ItemSlot, SlotState]] = []
+        for owner, changes in self._slot_changes:
+            where = item_totals.location(
+                owner.get("character_id"),
+                owner.get("storage", ItemSlot.StorageChoices.INVENTORY),
+            )
+            for slot_id, old in changes.deletes.items():
+                deletes.append(slot_id)
+                deltas.remove(old.item_id, where, old.count)
+            for slot_id, (old, new) in changes.updates.items():
+                slot = _make_slot(new, packed, id=slot_id, **owner)
+                updates.append((slot, old, new))
+                deltas.remove(old.item_id, where, old.count)
+                deltas.add(new.item_id, where, new.count)
+            for (bag, index), new in changes.inserts.items():
+                slot = _make_slot(new, packed, bag=bag, index=index, **owner)
+                inserts.append((slot, new))
+                deltas.add(new.item_id, where, new.count)
+
+        if deletes:
+            ItemSlot.objects.filter(id__in=deletes).delete()
+        if packed:
+            if updates:
+                ItemSlot.objects.bulk_update(
+                    [slot for slot, _, _ in updates],
+                    SLOT_UPDATE_FIELDS + PACKED_UPDATE_FIELDS,
+                )
+            if inserts:
+                ItemSlot.objects.bulk_create([slot for slot, _ in inserts])
+            _write_upgrade_index(updates, inserts)
+            return
+
+        # Upgrades and infusions, the last fields of the state, are M2M rows.
+        changed = [slot for slot, old, new in updates if old[:-2] != new[:-2]]
+        if changed:
+            ItemSlot.objects.bulk_update(changed, SLOT_UPDATE_FIELDS)
+        if inserts:
+            ItemSlot.objects.bulk_create([slot for slot, _ in inserts])
+
+        for through, attr in _THROUGH.items():
+            replaced = {
+                slot.id
+                for slot, old, new in updates
+                if getattr(old, attr) != getattr(new, attr)
+            }
+            if replaced:
+                through.objects.filter(itemslot_id__in=replaced).delete()
+            rows = [
+                through(itemslot_id=slot.id, item_id=item_id)
+                for slot, old, new in updates
+                if slot.id in replaced
+                for item_id in getattr(new, attr)
+            ]
+            rows.extend(
+                through(itemslot_id=slot.id, item_id=item_id)
+                for slot, new in inserts
+                for item_id in getattr(new, attr)
+            )
+            if rows:
+                through.objects.bulk_create(rows)
+
+
+def _write_upgrade_index(
+    updates: typing.List[typing.Tuple[ItemSlot, SlotState, SlotState]],
+    inserts: typing.List[typing.Tuple[ItemSlot, SlotState]],
+):
+    """Replace the `SlotUpgrade` rows of written slots whose upgrades changed."""
+    # Upgrades and infusions are the last fields of the state.
+    written = [(slot, new) for slot, old, new in updates if old[-2:] != new[-2:]]
+    if written:
+        SlotUpgrade.objects.filter(
+            slot_id__in=[slot.id for slot, _ in written]
+        ).delete()
+    written.extend(inserts)
+    rows = [
+        SlotUpgrade(slot_id=slot.id, item_id=item_id)
+        for slot, new in written
+        for item_id in {*new.upgrades, *new.infusions}
+    ]
+    if rows:
+        SlotUpgrade.objects.bulk_create(rows)
+
+
+_THROUGH = {
+    ItemSlot.upgrades.through: "upgrades",
+    ItemSlot.infusions.through: "infusions",
+}
+
+
+def _make_slot(state: SlotState, packed: bool, **kwargs) -> ItemSlot:
+    if packed:
+        kwargs["upgrade_ids"] = list(state.upgrades)
+        kwargs["infusion_ids"] = list(state.infusions)
+    return ItemSlot(
+        item_id=state.item_id,
+        count=state.count,
+        charges=state.charges,
+        binding=state.binding,
+        bound_to_id=state.bound_to_id,
+        **kwargs,
+    )
@@ -139,3 +139,64 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # App settings
 
 GW2_API_KEY = env.str("GW2_API_KEY")
+
+# Override to point the client at e.g. a local stub server.
+GW2_API_BASE_URL = env.str("GW2_API_BASE_URL", "https://api.guildwars2.com/")
+# Maximum number of keep-alive connections to the API.
+GW2_HTTP_POOL_SIZE = env.int("GW2_HTTP_POOL_SIZE", 10)
+GW2_HTTP_CONNECT_TIMEOUT = env.float("GW2_HTTP_CONNECT_TIMEOUT", 5.0)
+GW2_HTTP_READ_TIMEOUT = env.float("GW2_HTTP_READ_TIMEOUT", 30.0)
+
+# API rate limit shared by all clients: burst size, and refill rate in requests/second.
+GW2_API_BURST = env.int("GW2_API_BURST", 300)
+GW2_API_RATE = env.float("GW2_API_RATE", 5.0)
+# How many times a request refused with 429/503 is retried.
+GW2_API_MAX_RETRIES = env.int("GW2_API_MAX_RETRIES", 3)
+# Maximum number of concurrent requests during a sync.
+GW2_SYNC_CONCURRENCY = env.int("GW2_SYNC_CONCURRENCY", 8)
+
+# On-disk API response cache. Set GW2_CACHE_DIR to empty to disable.
+GW2_CACHE_DIR = env.str("GW2_CACHE_DIR", str(BASE_DIR / "cache" / "http"))
+GW2_CACHE_MAX_BYTES = env.int("GW2_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+# Seconds a cached response is used without revalidation: items rarely change,
+# characters and inventories do.
+GW2_CACHE_TTL_IMMUTABLE = env.float("GW2_CACHE_TTL_IMMUTABLE", 7 * 24 * 3600)
+GW2_CACHE_TTL_VOLATILE = env.float("GW2_CACHE_TTL_VOLATILE", 60)
+
+# Serve API responses from recorded files (see gw2inv_app.replay) instead of the API,
+# optionally with extra latency (seconds) and a random 503 error rate (0..1).
+GW2_REPLAY_DIR = env.str("GW2_REPLAY_DIR", "")
+GW2_REPLAY_LATENCY = env.float("GW2_REPLAY_LATENCY", 0.0)
+GW2_REPLAY_ERROR_RATE = env.float("GW2_REPLAY_ERROR_RATE", 0.0)
+# Record API responses into this directory in the replay format.
+GW2_RECORD_DIR = env.str("GW2_RECORD_DIR", "")
+
+# Seconds a worker may hold a PendingData row before others may take it over.
+GW2_QUEUE_LEASE_SECONDS = env.int("GW2_QUEUE_LEASE_SECONDS", 300)
+
+# Store ItemSlot upgrades and infusions as ordered id arrays on the slot instead of
+# the upgrades/infusions M2M relations: fewer rows to write, slots load in one query.
+GW2_PACKED_UPGRADES = env.bool("GW2_PACKED_UPGRADES", False)
+
+# Background sync jobs: seconds between progress writes, seconds between
+# writes of a running job without progress, and seconds without a write after
+# which a job is considered dead (keep it well above the heartbeat).
+GW2_JOB_PROGRESS_INTERVAL = env.float("GW2_JOB_PROGRESS_INTERVAL", 1.0)
+GW2_JOB_HEARTBEAT_SECONDS = env.float("GW2_JOB_HEARTBEAT_SECONDS", 60.0)
+GW2_JOB_STALE_SECONDS = env.int("GW2_JOB_STALE_SECONDS", 600)
+# Maximum number of progress events per second sent to each viewer of a job.
+GW2_JOB_EVENTS_RATE = env.float("GW2_JOB_EVENTS_RATE", 10.0)
+
+# SQLite tuning for syncs running alongside page loads: WAL journal, relaxed fsync,
+# bigger caches (see gw2inv_app.sqlite_profile). Lock wait in milliseconds.
+GW2_SQLITE_PROFILE = env.bool("GW2_SQLITE_PROFILE", False)
+GW2_SQLITE_BUSY_TIMEOUT = env.int("GW2_SQLITE_BUSY_TIMEOUT", 5000)
+
+# Read views are cached by the account data version, bumped after each sync. Seconds
+# the version itself is cached (0: until bumped, for caches shared by all processes
+# running syncs), and seconds rendered fragments are kept.
+GW2_DATA_VERSION_TTL = env.int("GW2_DATA_VERSION_TTL", 60)
+GW2_FRAGMENT_CACHE_TIMEOUT = env.int("GW2_FRAGMENT_CACHE_TIMEOUT", 24 * 3600)
+
+# Serve GW2 API request metrics (see gw2inv_app.http_metrics) at debug/api_metrics.
+GW2_HTTP_METRICS_ENDPOINT = env.bool("GW2_HTTP_METRICS_ENDPOINT", DEBUG)